@@ -1,4 +1,4 @@
-from requests import Response
+from httpx import Response
 
 from .response import ApiException, ApiResponse
 from .data import Error, Success
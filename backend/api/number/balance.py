@@ -6,6 +6,7 @@ from fastapi import status
 from api.models.response import ApiException
 from api.models.data import Error
 from .cms import NEGCRED_LOOKUP
+from .client import gather
 from .zend import zend_balance, zend_subscriptions
 
 
@@ -19,13 +20,16 @@ class Wallet(BaseModel):
     loan: WalletEntry
 
 
-def get_wallet(msisdn: str) -> Wallet:
+async def get_wallet(msisdn: str) -> Wallet:
     """Main wallet balance + negative credit subscription"""
 
     try:
-        raw_balance: dict[str, Any] = zend_balance(msisdn)
+        raw_balance: dict[str, Any]
+        raw_subscriptions: list[dict[str, Any]]
+        raw_balance, raw_subscriptions = await gather(
+            zend_balance(msisdn), zend_subscriptions(msisdn)
+        )
         """{"amount": 100000, "validity":"20220801"}"""
-        raw_subscriptions: list[dict[str, Any]] = zend_subscriptions(msisdn)
         """[{"id": "123", "cyle_end": "20220426000000", "expire_time":"20370101000000"}]"""
 
         loan = WalletEntry(value=None, expiry=None)
@@ -0,0 +1,142 @@
+""" Circuit breaker and bulkhead isolation per zend endpoint """
+
+import time
+from collections import Counter
+from typing import Awaitable, Callable
+import httpx
+from fastapi import status
+from api.models.response import ApiException
+from utils.logger import logger
+from utils.settings import settings
+from .models.errors import ZEND_UNAVAILABLE
+
+
+class ZendUnavailable(ApiException):
+    """Raised without calling upstream: circuit open or bulkhead full"""
+
+    def __init__(self):
+        super().__init__(status.HTTP_503_SERVICE_UNAVAILABLE, ZEND_UNAVAILABLE)
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures, fails fast for
+    reset_timeout seconds, then lets a single probe through (half open).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.transitions: Counter[str] = Counter()
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(
+                "Zend circuit %s: %s -> %s",
+                self.name,
+                self.state,
+                state,
+                extra={
+                    "props": {"circuit": self.name, "from": self.state, "to": state}
+                },
+            )
+            self.transitions[state] += 1
+            self.state = state
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                return False
+            self.probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.probing = False
+        self.failures = 0
+        self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.probing = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def release(self) -> None:
+        """The call ended without an outcome (e.g. cancelled)"""
+        self.probing = False
+
+
+class Guard:
+    """Circuit breaker plus a fail-fast concurrency limit for one endpoint"""
+
+    def __init__(self, name: str):
+        self.breaker = CircuitBreaker(
+            name,
+            settings.zend_breaker_failure_threshold,
+            settings.zend_breaker_reset_timeout,
+        )
+        self.limit = settings.zend_bulkhead_limit
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def call(
+        self, send: Callable[[], Awaitable[httpx.Response]]
+    ) -> httpx.Response:
+        if self.in_flight >= self.limit or not self.breaker.allow():
+            self.rejected += 1
+            raise ZendUnavailable()
+        self.in_flight += 1
+        outcome: bool | None = None
+        try:
+            response = await send()
+            # 4xx are business answers (e.g. unknown msisdn), not outages
+            outcome = response.status_code < 500
+            return response
+        except httpx.TransportError:
+            outcome = False
+            raise
+        finally:
+            self.in_flight -= 1
+            if outcome is True:
+                self.breaker.record_success()
+            elif outcome is False:
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "failures": self.breaker.failures,
+            "transitions": dict(self.breaker.transitions),
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+        }
+
+
+guards: dict[str, Guard] = {}
+
+
+def guard(name: str) -> Guard:
+    if name not in guards:
+        guards[name] = Guard(name)
+    return guards[name]
+
+
+def stats() -> dict[str, dict]:
+    """Breaker & bulkhead state of every endpoint called so far"""
+    return {name: one.stats() for name, one in guards.items()}
@@ -0,0 +1,193 @@
+""" Per-worker caching of zend lookups """
+
+import asyncio
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Awaitable, Callable
+from utils.logger import logger
+from utils.settings import settings
+from . import memo, shared_cache
+from .client import deadline_scope
+
+ZendLookup = Callable[..., Awaitable[Any]]
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded LRU mapping. Entries are fresh for ttl seconds after being set,
+    then stale (see get_stale) until stale_ttl seconds, then gone.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, stale_ttl: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = max(ttl, stale_ttl)
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._entries
+
+    def _age(self, key: Any) -> float | None:
+        """Age of a not yet hard-expired entry, dropping it otherwise"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        age = time.monotonic() - entry[0]
+        if age >= self.stale_ttl:
+            del self._entries[key]
+            return None
+        return age
+
+    def get(self, key: Any) -> Any:
+        """Fresh value or MISSING"""
+        age = self._age(key)
+        if age is None or age >= self.ttl:
+            if age is not None:
+                self.expirations += 1
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key][1]
+
+    def get_stale(self, key: Any) -> Any:
+        """Value past its ttl but within stale_ttl, or MISSING"""
+        if self._age(key) is None:
+            return MISSING
+        self.stale_hits += 1
+        return self._entries[key][1]
+
+    def set(self, key: Any, value: Any) -> None:
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Any) -> None:
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+subscriber_cache = TTLCache(
+    settings.zend_cache_size, settings.zend_cache_ttl, settings.zend_cache_stale_ttl
+)
+
+# msisdn -> unified_sim_status of msisdns found ineligible (BLOCK_*)
+ineligible_cache = TTLCache(
+    settings.zend_ineligible_cache_size, settings.zend_ineligible_cache_ttl
+)
+
+# names of the lookups stored in subscriber_cache, keyed (name, msisdn)
+_cached_lookups: set[str] = set()
+
+# background refreshes in flight, by key
+_refreshing: dict[tuple[str, str], asyncio.Task] = {}
+
+
+async def _refresh(key: tuple[str, str], func: ZendLookup, msisdn: str) -> None:
+    try:
+        with deadline_scope(settings.zend_deadline, detached=True):
+            value = await func(msisdn)
+        # an invalidation during the refresh wins over the refreshed value
+        if key in subscriber_cache:
+            subscriber_cache.set(key, value)
+    except Exception as ex:
+        logger.warning("Background refresh of %s failed: %s", key, ex)
+    finally:
+        _refreshing.pop(key, None)
+
+
+def cached(func: ZendLookup) -> ZendLookup:
+    """
+    Serve a msisdn lookup from subscriber_cache for its ttl, only successes
+    are stored. Past the ttl the lookup waits for a fresh value.
+    """
+    _cached_lookups.add(func.__name__)
+
+    @wraps(func)
+    async def wrapper(msisdn: str) -> Any:
+        key = (func.__name__, msisdn)
+        value = subscriber_cache.get(key)
+        if value is not MISSING:
+            return value
+        value = await func(msisdn)
+        subscriber_cache.set(key, value)
+        return value
+
+    return wrapper
+
+
+def stale_while_revalidate(func: ZendLookup) -> ZendLookup:
+    """
+    As cached, but past its ttl a value is still served at once while a
+    single background call refreshes it. Up to stale_ttl the stale value
+    keeps being served when that refresh fails (e.g. upstream outage).
+
+    Only for slow-changing data: status-critical lookups (zend_sim) use
+    cached, they must never be served a day old.
+    """
+    _cached_lookups.add(func.__name__)
+
+    @wraps(func)
+    async def wrapper(msisdn: str) -> Any:
+        key = (func.__name__, msisdn)
+        value = subscriber_cache.get(key)
+        if value is not MISSING:
+            return value
+        value = subscriber_cache.get_stale(key)
+        if value is not MISSING:
+            if key not in _refreshing:
+                _refreshing[key] = asyncio.create_task(_refresh(key, func, msisdn))
+            return value
+        value = await func(msisdn)
+        subscriber_cache.set(key, value)
+        return value
+
+    return wrapper
+
+
+async def invalidate(msisdn: str) -> None:
+    """Forget every cached lookup of msisdn, in this worker and the shared cache"""
+    for name in _cached_lookups:
+        subscriber_cache.delete((name, msisdn))
+    ineligible_cache.delete(msisdn)
+    memo.forget(msisdn)
+    await shared_cache.evict(msisdn)
+
+
+def invalidates(func: ZendLookup) -> ZendLookup:
+    """Invalidate the msisdn (first argument) once a write to zend succeeds"""
+
+    @wraps(func)
+    async def wrapper(msisdn: str, *args, **kwargs) -> Any:
+        result = await func(msisdn, *args, **kwargs)
+        await invalidate(msisdn)
+        return result
+
+    return wrapper
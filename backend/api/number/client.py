@@ -0,0 +1,140 @@
+""" Async, connection-pooled http client for zain backend services (aka zend) """
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable
+import httpx
+from fastapi import status
+from api.models.response import ApiException
+from utils import metrics
+from utils.settings import settings
+from .models.errors import ZEND_TIMEOUT
+from . import breaker, hedge, mock_transport, retry, shared_cache
+
+_client: httpx.AsyncClient | None = None
+_client_loop: asyncio.AbstractEventLoop | None = None
+
+# time.monotonic() by which the current request must have answered
+_deadline: ContextVar[float | None] = ContextVar("zend_deadline", default=None)
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Shared keep-alive client for the current worker.
+
+    Connections are bound to the event loop they were opened on, so a new
+    pool is created whenever the running loop changes (e.g. under TestClient).
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.zend_timeout, connect=settings.zend_connect_timeout
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.zend_max_connections,
+                max_keepalive_connections=settings.zend_max_keepalive_connections,
+                keepalive_expiry=settings.zend_keepalive_expiry,
+            ),
+            transport=mock_transport.transport if settings.mock_zain_api else None,
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_client() -> None:
+    """Release pooled connections, called on application shutdown"""
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+@contextmanager
+def deadline_scope(timeout: float, detached: bool = False):
+    """
+    Bound the zend calls made inside to timeout seconds, never beyond the
+    enclosing deadline unless detached (e.g. background or per-item work).
+    """
+    deadline = time.monotonic() + timeout
+    if not detached and (current := _deadline.get()) is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float | None:
+    """Seconds left before the current deadline, None without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+async def _send(method: str, endpoint: str, url: str, **kwargs) -> httpx.Response:
+    """One upstream call, guarded by the endpoint's breaker and measured"""
+    name = shared_cache.endpoint_name(endpoint)
+
+    async def send() -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await get_client().request(method, url, **kwargs)
+        except httpx.TransportError:
+            metrics.zend_responses.labels(name, "error").inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.zend_latency.labels(name).observe(elapsed)
+        # only answered attempts, cancelled hedges would bias the window low
+        hedge.record(name, elapsed)
+        metrics.zend_responses.labels(name, response.status_code).inc()
+        metrics.zend_response_bytes.labels(name).inc(len(response.content))
+        return response
+
+    return await breaker.guard(name).call(send)
+
+
+async def get(endpoint: str, msisdn: str) -> httpx.Response:
+    """GET {endpoint}{msisdn} through the shared cache, then the shared pool"""
+    url = f"{endpoint}{msisdn}"
+    key = shared_cache.cache_key(endpoint, msisdn)
+    ttl = shared_cache.ttl_for(endpoint)
+    if ttl and (body := await shared_cache.load(key)) is not None:
+        return httpx.Response(200, content=body, request=httpx.Request("GET", url))
+    name = shared_cache.endpoint_name(endpoint)
+    response = await retry.with_retries(
+        name,
+        lambda: hedge.hedged(name, lambda: _send("GET", endpoint, url)),
+        remaining,
+    )
+    if ttl and response.is_success:
+        await shared_cache.store(key, response.content, ttl)
+    return response
+
+
+async def post(endpoint: str, json: dict) -> httpx.Response:
+    """POST a json body to endpoint through the shared pool"""
+    return await _send("POST", endpoint, endpoint, json=json)
+
+
+async def gather(*aws: Awaitable[Any], timeout: float | None = None) -> list[Any]:
+    """
+    Run independent zend calls concurrently under one shared deadline
+    (settings.zend_deadline by default, within the request's own deadline).
+    The first failure cancels the rest.
+    """
+    with deadline_scope(timeout or settings.zend_deadline):
+        tasks = [asyncio.ensure_future(aw) for aw in aws]
+        left = remaining()
+    try:
+        return await asyncio.wait_for(asyncio.gather(*tasks), max(left, 0))
+    except asyncio.TimeoutError as ex:
+        raise ApiException(status.HTTP_504_GATEWAY_TIMEOUT, ZEND_TIMEOUT) from ex
+    finally:
+        for task in tasks:
+            task.cancel()
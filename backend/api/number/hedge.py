@@ -0,0 +1,95 @@
+""" Hedged requests for read-only zend calls (tail-latency reduction) """
+
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable
+import httpx
+from utils import metrics
+from utils.settings import settings
+from .retry import RetryBudget
+
+
+class LatencyWindow:
+    """Recent latencies of one endpoint, with a lazily refreshed percentile"""
+
+    refresh_every = 50
+
+    def __init__(self, size: int):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._added = 0
+        self._percentiles: dict[float, float] = {}
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._added += 1
+        if self._added % self.refresh_every == 0:
+            self._percentiles.clear()
+
+    def percentile(self, q: float) -> float | None:
+        """q in [0, 1], None until enough samples were seen"""
+        if len(self._samples) < settings.zend_hedge_min_samples:
+            return None
+        if q not in self._percentiles:
+            ordered = sorted(self._samples)
+            index = min(len(ordered) - 1, int(q * len(ordered)))
+            self._percentiles[q] = ordered[index]
+        return self._percentiles[q]
+
+
+windows: dict[str, LatencyWindow] = {}
+
+# hedges are capped to a ratio of the hedgeable calls
+budget = RetryBudget(settings.zend_hedge_max_ratio, 0, settings.zend_hedge_budget_cap)
+
+
+def record(name: str, seconds: float) -> None:
+    """Latency of one upstream attempt"""
+    if name not in windows:
+        windows[name] = LatencyWindow(settings.zend_hedge_window)
+    windows[name].add(seconds)
+
+
+def _succeeded(task: asyncio.Future) -> bool:
+    return not task.exception() and task.result().status_code < 500
+
+
+async def hedged(
+    name: str, send: Callable[[], Awaitable[httpx.Response]]
+) -> httpx.Response:
+    """
+    Call send; if it hasn't answered by the configured percentile of recent
+    latency, send an identical second request. The first successful answer
+    wins and the other one is cancelled; an error (5xx or transport) from
+    one attempt waits for the other, and is returned only if both fail.
+    """
+    if not settings.zend_hedge:
+        return await send()
+    budget.deposit()
+    window = windows.get(name)
+    delay = window.percentile(settings.zend_hedge_percentile) if window else None
+
+    first = asyncio.ensure_future(send())
+    if delay is None:
+        return await first
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done or not budget.withdraw():
+        return await first
+
+    metrics.zend_hedges.labels(name).inc()
+    second = asyncio.ensure_future(send())
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            if winner := next((task for task in done if _succeeded(task)), None):
+                if winner is second:
+                    metrics.zend_hedge_wins.labels(name).inc()
+                return winner.result()
+        # both failed, prefer an answer (its status drives the retry policy)
+        answered = [task for task in (first, second) if not task.exception()]
+        return (answered[0] if answered else first).result()
+    finally:
+        first.cancel()
+        second.cancel()
@@ -0,0 +1,72 @@
+from enum import Enum
+from typing import Any, Awaitable, Callable
+from pydantic import BaseModel
+from api.models.data import Error
+from api.models.response import ApiException
+from .balance import Wallet, get_wallet
+from .client import gather
+from .sim import Sim, get_sim_details, get_welcome_message
+from .subaccount import Subaccount
+from .subscriptions import Subscription, get_subscriptions
+from .zend import get_free_units
+
+
+class HomeSection(str, Enum):
+    status = "status"
+    wallet = "wallet"
+    subscriptions = "subscriptions"
+    subaccounts = "subaccounts"
+    welcome_message = "welcome_message"
+
+
+class Home(BaseModel):
+    """Home screen sections, only the requested ones are set"""
+
+    status: Sim | None = None
+    wallet: Wallet | None = None
+    subscriptions: list[Subscription] | None = None
+    subaccounts: list[Subaccount] | None = None
+    welcome_message: dict[str, str] | None = None
+    # failed sections
+    errors: dict[HomeSection, Error] | None = None
+
+
+async def _welcome_message(msisdn: str) -> dict[str, str]:
+    return {"nba": await get_welcome_message(msisdn)}
+
+
+LOADERS: dict[HomeSection, Callable[[str], Awaitable[Any]]] = {
+    HomeSection.status: get_sim_details,
+    HomeSection.wallet: get_wallet,
+    HomeSection.subscriptions: get_subscriptions,
+    HomeSection.subaccounts: get_free_units,
+    HomeSection.welcome_message: _welcome_message,
+}
+
+
+async def _settle(load: Awaitable[Any]) -> Any | Error:
+    """A section's data, or its error so the other sections still load"""
+    try:
+        return await load
+    except ApiException as ex:
+        return ex.error
+
+
+async def get_home(msisdn: str, sections: list[HomeSection]) -> Home:
+    """
+    Load the requested sections concurrently, under one deadline. Within the
+    request scope each zend resource is fetched once (e.g. zend_subscriptions
+    for wallet & subscriptions, zend_sim for status & welcome_message).
+    """
+    sections = list(dict.fromkeys(sections))
+    results = await gather(*(_settle(LOADERS[one](msisdn)) for one in sections))
+
+    home = Home()
+    errors: dict[HomeSection, Error] = {}
+    for section, result in zip(sections, results):
+        if isinstance(result, Error):
+            errors[section] = result
+        else:
+            setattr(home, section.value, result)
+    home.errors = errors or None
+    return home
@@ -0,0 +1,113 @@
+""" Idempotency-Key support for zend write operations """
+
+import asyncio
+import hashlib
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+from fastapi import Response, status
+from api.models.response import ApiException, ApiResponse
+from api.serialization import model_bytes
+from utils.settings import settings
+from .models.errors import IDEMPOTENCY_IN_PROGRESS, IDEMPOTENCY_KEY_REUSED
+from .repository import (
+    delete_expired_idempotency_keys,
+    get_idempotency_key,
+    release_idempotency_key,
+    reserve_idempotency_key,
+    save_idempotent_response,
+)
+
+# first executions in flight in this worker (request hash, outcome), by key
+_in_flight: dict[str, tuple[str, asyncio.Future]] = {}
+
+# share of reservations that also sweep expired keys
+purge_ratio = 0.01
+
+
+def _request_hash(params: dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def _check_same_request(request_hash: str, stored_hash: str | None) -> None:
+    if stored_hash != request_hash:
+        raise ApiException(status.HTTP_422_UNPROCESSABLE_ENTITY, IDEMPOTENCY_KEY_REUSED)
+
+
+def _replay(status_code: int, body: bytes) -> Response:
+    return Response(
+        body,
+        status_code=status_code,
+        media_type="application/json",
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+async def _wait_stored(key: str, request_hash: str) -> Response:
+    """Wait for another worker's first execution of key to be stored"""
+    deadline = time.monotonic() + settings.idempotency_wait
+    lease = timedelta(seconds=settings.idempotency_lease)
+    while time.monotonic() < deadline:
+        stored = await get_idempotency_key(key)
+        if stored is None:
+            # the first execution failed and released the key
+            break
+        _check_same_request(request_hash, stored.request_hash)
+        if stored.body is not None:
+            return _replay(stored.status_code, stored.body)
+        if stored.created_at <= datetime.now(timezone.utc) - lease:
+            # abandoned by its worker, the client's next retry takes it over
+            break
+        await asyncio.sleep(0.1)
+    raise ApiException(status.HTTP_409_CONFLICT, IDEMPOTENCY_IN_PROGRESS)
+
+
+async def idempotent(
+    key: str | None,
+    scope: str,
+    params: dict[str, Any],
+    execute: Callable[[], Awaitable[ApiResponse]],
+) -> ApiResponse | Response:
+    """
+    Run execute once per (scope, Idempotency-Key). Repeated keys get the
+    stored response bytes back, concurrent duplicates wait for the first
+    execution. Failed executions are not stored and can be retried.
+    A key reused with different request params is rejected with a 422.
+    """
+    if not key:
+        return await execute()
+    key = f"{scope}:{key}"
+    request_hash = _request_hash(params)
+
+    if (in_flight := _in_flight.get(key)) is not None:
+        _check_same_request(request_hash, in_flight[0])
+        return _replay(*await asyncio.shield(in_flight[1]))
+    if not await reserve_idempotency_key(
+        key, request_hash, settings.idempotency_ttl, settings.idempotency_lease
+    ):
+        return await _wait_stored(key, request_hash)
+    if random.random() < purge_ratio:
+        await delete_expired_idempotency_keys()
+
+    first = asyncio.get_running_loop().create_future()
+    # mark the outcome retrieved even when nobody waited on it
+    first.add_done_callback(lambda future: future.cancelled() or future.exception())
+    _in_flight[key] = (request_hash, first)
+    try:
+        response = await execute()
+        body = model_bytes(response)
+        await save_idempotent_response(key, status.HTTP_200_OK, body)
+        first.set_result((status.HTTP_200_OK, body))
+        return Response(body, media_type="application/json")
+    except Exception as ex:
+        await release_idempotency_key(key)
+        first.set_exception(ex)
+        raise
+    except BaseException:
+        await release_idempotency_key(key)
+        first.cancel()
+        raise
+    finally:
+        _in_flight.pop(key, None)
@@ -0,0 +1,52 @@
+""" Request-scoped single-flight for zend lookups """
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Awaitable, Callable
+
+ZendLookup = Callable[[str], Awaitable[Any]]
+
+_in_flight: ContextVar[dict[tuple[str, str], asyncio.Future] | None] = ContextVar(
+    "zend_in_flight", default=None
+)
+
+
+@contextmanager
+def request_scope():
+    """Share identical zend lookups for the duration of one request"""
+    token = _in_flight.set({})
+    try:
+        yield
+    finally:
+        _in_flight.reset(token)
+
+
+def single_flight(func: ZendLookup) -> ZendLookup:
+    """
+    Identical (endpoint, msisdn) calls made inside a request_scope share a
+    single in-flight upstream call. Results are shared, treat them as read-only.
+    Outside of a request scope the lookup is called as is.
+    """
+
+    @wraps(func)
+    async def wrapper(msisdn: str) -> Any:
+        calls = _in_flight.get()
+        if calls is None:
+            return await func(msisdn)
+        key = (func.__name__, msisdn)
+        if key not in calls:
+            calls[key] = asyncio.ensure_future(func(msisdn))
+        # a cancelled caller must not cancel the call shared with the others
+        return await asyncio.shield(calls[key])
+
+    return wrapper
+
+
+def forget(msisdn: str) -> None:
+    """Drop the lookups of msisdn shared in the current request"""
+    calls = _in_flight.get()
+    if calls:
+        for key in [key for key in calls if key[1] == msisdn]:
+            del calls[key]
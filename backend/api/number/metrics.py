@@ -0,0 +1,62 @@
+""" Prometheus view of the zend cache and circuit breakers """
+
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from utils import metrics
+from . import breaker
+from .cache import ineligible_cache, subscriber_cache
+
+CACHES = {"subscriber": subscriber_cache, "ineligible": ineligible_cache}
+
+STATES = (
+    breaker.CircuitBreaker.CLOSED,
+    breaker.CircuitBreaker.OPEN,
+    breaker.CircuitBreaker.HALF_OPEN,
+)
+
+
+class ZendCollector:
+    """Reads the in-process cache & breaker counters at scrape time"""
+
+    def collect(self):
+        size = GaugeMetricFamily(
+            "zend_cache_size", "Entries in the zend caches", labels=["cache"]
+        )
+        events = CounterMetricFamily(
+            "zend_cache_events", "Zend cache events", labels=["cache", "event"]
+        )
+        for name, cache in CACHES.items():
+            stats = cache.stats()
+            size.add_metric([name], stats.pop("size"))
+            for event, count in stats.items():
+                events.add_metric([name, event], count)
+        yield from (size, events)
+
+        state = GaugeMetricFamily(
+            "zend_circuit_state",
+            "1 for the current circuit state of each zend endpoint",
+            labels=["endpoint", "state"],
+        )
+        transitions = CounterMetricFamily(
+            "zend_circuit_transitions",
+            "Circuit state changes",
+            labels=["endpoint", "state"],
+        )
+        in_flight = GaugeMetricFamily(
+            "zend_bulkhead_in_flight", "Calls in flight", labels=["endpoint"]
+        )
+        rejected = CounterMetricFamily(
+            "zend_bulkhead_rejected",
+            "Calls rejected by an open circuit or a full bulkhead",
+            labels=["endpoint"],
+        )
+        for endpoint, one in breaker.stats().items():
+            for name in STATES:
+                state.add_metric([endpoint, name], int(one["state"] == name))
+            for name, count in one["transitions"].items():
+                transitions.add_metric([endpoint, name], count)
+            in_flight.add_metric([endpoint], one["in_flight"])
+            rejected.add_metric([endpoint], one["rejected"])
+        yield from (state, transitions, in_flight, rejected)
+
+
+metrics.register_collector(ZendCollector())
@@ -0,0 +1,62 @@
+""" In-process zend transport answering from preloaded fixtures (mock_zain_api) """
+
+import asyncio
+import json
+import os
+import random
+from pathlib import Path
+import httpx
+from utils.settings import settings
+
+path = f"{os.path.dirname(__file__)}/mocks/"
+
+# url prefix -> mock fixture file, registered by zend
+routes: dict[str, str] = {}
+
+# fixture file -> body
+_fixtures: dict[str, bytes] = {}
+
+
+def load() -> None:
+    """Read every fixture in ./mocks/ once"""
+    if not _fixtures:
+        for fixture in Path(path).glob("*.json"):
+            _fixtures[fixture.name] = fixture.read_bytes()
+
+
+def _latency() -> float:
+    """Log-normal latency around the configured median, in seconds"""
+    median = settings.mock_zain_latency_median
+    if median <= 0:
+        return 0
+    return median * random.lognormvariate(0, settings.mock_zain_latency_sigma)
+
+
+def _error(code: int, message: str) -> httpx.Response:
+    return httpx.Response(
+        code,
+        content=json.dumps({"error": {"code": code, "message": message}}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+
+
+async def handler(request: httpx.Request) -> httpx.Response:
+    """Answer a zend request from the matching fixture, with simulated latency"""
+    load()
+    if latency := _latency():
+        await asyncio.sleep(latency)
+    if random.random() < settings.mock_zain_error_rate:
+        return _error(503, "Simulated Zain backend failure")
+
+    url = str(request.url)
+    prefixes = [prefix for prefix in routes if url.startswith(prefix)]
+    if not prefixes:
+        return _error(404, f"No mock for {url}")
+    return httpx.Response(
+        200,
+        content=_fixtures[routes[max(prefixes, key=len)]],
+        headers={"Content-Type": "application/json"},
+    )
+
+
+transport = httpx.MockTransport(handler)
@@ -5,3 +5,27 @@ MSISDN_MISMATCH = Error(
     code=300,
     message="The MSISDN does not match.",
 )
+
+ZEND_TIMEOUT = Error(
+    type="zend",
+    code=504,
+    message="The Zain backend did not answer in time.",
+)
+
+ZEND_UNAVAILABLE = Error(
+    type="zend",
+    code=503,
+    message="The Zain backend is temporarily unavailable.",
+)
+
+IDEMPOTENCY_IN_PROGRESS = Error(
+    type="idempotency",
+    code=409,
+    message="A request with this Idempotency-Key is still being processed.",
+)
+
+IDEMPOTENCY_KEY_REUSED = Error(
+    type="idempotency",
+    code=422,
+    message="This Idempotency-Key was already used with different parameters.",
+)
@@ -0,0 +1,12 @@
+from pydantic import BaseModel, Field, constr
+import utils.regex as rgx
+from utils.settings import settings
+
+
+class BatchStatusRequest(BaseModel):
+    msisdns: list[constr(regex=rgx.MSISDN)] = Field(
+        ...,
+        min_items=1,
+        max_items=settings.zend_batch_max_size,
+        example=["7839921514", "7841631859"],
+    )
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from api.number.balance import Wallet
+from api.number.home import Home
 from api.number.subaccount import Subaccount
 from api.models.response import ApiResponse
 from api.number.sim import Sim
@@ -41,6 +42,10 @@ class SubaccountsResponse(ApiResponse):
         }
 
 
+class HomeResponse(ApiResponse):
+    data: Home
+
+
 class nbaResponse(ApiResponse):
     data: dict[str, str] = Field(..., example={"nba": "POSTPAID_PRIME_NBA"})
 
@@ -0,0 +1,85 @@
+"""
+DB Operations for the number package model. These commit in their own
+sessions, not in the request's unit of work: a reserved key has to be
+visible to the other workers at once.
+"""
+
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from db.main import AsyncSessionLocal
+from db.models import IdempotencyKey
+
+
+async def reserve_idempotency_key(
+    key: str, request_hash: str, ttl: float, lease: float
+) -> bool:
+    """
+    Claim key for a first execution, False if it is already claimed. A claim
+    left unfinished for lease seconds is abandoned and can be taken over.
+    """
+    now = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.key == key,
+                or_(
+                    IdempotencyKey.expires_at <= now,
+                    and_(
+                        IdempotencyKey.body.is_(None),
+                        IdempotencyKey.created_at <= now - timedelta(seconds=lease),
+                    ),
+                ),
+            )
+        )
+        result = await session.execute(
+            insert(IdempotencyKey)
+            .values(
+                key=key,
+                request_hash=request_hash,
+                created_at=now,
+                expires_at=now + timedelta(seconds=ttl),
+            )
+            .on_conflict_do_nothing()
+        )
+        await session.commit()
+        return result.rowcount == 1
+
+
+async def get_idempotency_key(key: str) -> IdempotencyKey | None:
+    """Retrieve an unexpired key"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(IdempotencyKey).where(
+                IdempotencyKey.key == key,
+                IdempotencyKey.expires_at > datetime.now(timezone.utc),
+            )
+        )
+        return result.scalars().first()
+
+
+async def save_idempotent_response(key: str, status_code: int, body: bytes) -> None:
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key == key)
+            .values(status_code=status_code, body=body)
+        )
+        await session.commit()
+
+
+async def release_idempotency_key(key: str) -> None:
+    """Forget a key whose request failed, so that it can be retried"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+        await session.commit()
+
+
+async def delete_expired_idempotency_keys() -> None:
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(IdempotencyKey).where(
+                IdempotencyKey.expires_at <= datetime.now(timezone.utc)
+            )
+        )
+        await session.commit()
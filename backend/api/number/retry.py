@@ -0,0 +1,106 @@
+""" Jittered retries of idempotent zend reads """
+
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable
+import httpx
+from fastapi import status
+from api.models.response import ApiException
+from utils import metrics
+from utils.settings import settings
+from .models.errors import ZEND_TIMEOUT
+
+RETRY_STATUSES = {
+    status.HTTP_502_BAD_GATEWAY,
+    status.HTTP_503_SERVICE_UNAVAILABLE,
+    status.HTTP_504_GATEWAY_TIMEOUT,
+}
+
+
+class RetryBudget:
+    """
+    Caps retries to a ratio of live traffic: each call deposits `ratio`
+    tokens, each retry withdraws one. `min_per_second` tokens trickle in so
+    low traffic can still retry; the balance never exceeds `cap`.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, cap: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.cap = cap
+        self.balance = cap
+        self._refilled_at = time.monotonic()
+
+    def deposit(self) -> None:
+        self.balance = min(self.cap, self.balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        now = time.monotonic()
+        self.balance = min(
+            self.cap, self.balance + (now - self._refilled_at) * self.min_per_second
+        )
+        self._refilled_at = now
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+budget = RetryBudget(
+    settings.zend_retry_budget_ratio,
+    settings.zend_retry_budget_min_per_second,
+    settings.zend_retry_budget_cap,
+)
+
+
+def backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter, attempt starts at 1"""
+    ceiling = settings.zend_retry_base_delay * 2 ** (attempt - 1)
+    return random.uniform(0, min(settings.zend_retry_max_delay, ceiling))
+
+
+async def with_retries(
+    name: str,
+    send: Callable[[], Awaitable[httpx.Response]],
+    remaining: Callable[[], float | None],
+) -> httpx.Response:
+    """
+    Call send, retrying transport errors and 502/503/504 answers up to
+    settings.zend_retry_attempts times while the retry budget and the time
+    left before the request deadline (remaining()) allow it. No attempt runs
+    past that deadline: it is answered with a 504 ApiException instead.
+    """
+    budget.deposit()
+    attempt = 0
+    while True:
+        failure: httpx.TransportError | None = None
+        left = remaining()
+        try:
+            if left is None:
+                response = await send()
+            else:
+                response = await asyncio.wait_for(send(), max(left, 0))
+            if response.status_code not in RETRY_STATUSES:
+                return response
+        except httpx.TransportError as ex:
+            failure = ex
+        except asyncio.TimeoutError as ex:
+            raise ApiException(status.HTTP_504_GATEWAY_TIMEOUT, ZEND_TIMEOUT) from ex
+
+        attempt += 1
+        delay = backoff(attempt)
+        left = remaining()
+        if attempt > settings.zend_retry_attempts or (
+            left is not None and left <= delay
+        ):
+            break
+        if not budget.withdraw():
+            metrics.zend_retries_exhausted.labels(name).inc()
+            break
+        metrics.zend_retries.labels(name).inc()
+        await asyncio.sleep(delay)
+
+    if failure:
+        raise failure
+    return response
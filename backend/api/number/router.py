@@ -4,10 +4,13 @@ This is the middle-ware that connects with
 zain backend systems (aka zain-backend)
 """
 
-from fastapi import APIRouter, Body, Query, Depends, status
+from fastapi import APIRouter, Body, Header, Query, Depends, status
+from fastapi.responses import StreamingResponse
 from api.number.models.response import SubaccountsResponse, nbaResponse
 from .balance import get_wallet
-from .sim import get_sim_details
+from .home import HomeSection, get_home
+from .idempotency import idempotent
+from .sim import get_sim_details, get_welcome_message, stream_sim_details
 from .subscriptions import get_subscriptions
 from .zend import (
     recharge_voucher,
@@ -15,22 +18,22 @@ from .zend import (
     get_free_units,
     query_bill,
     zend_change_subscription,
-    zend_sim,
-    is_4g_compatible,
 )
+from api.serialization import FastRoute
 from utils.jwt import JWTBearer
 from utils.settings import settings
 import utils.regex as rgx
 from api.number.models.response import (
+    HomeResponse,
     RetrieveStatusResponse,
     SubscriptionsResponse,
     WalletResponse,
 )
 from api.models.response import ApiException, ApiResponse
 from .models.errors import MSISDN_MISMATCH
-from .sim_helper import get_nba
+from .models.request import BatchStatusRequest
 
-router = APIRouter()
+router = APIRouter(route_class=FastRoute)
 
 
 @router.get(
@@ -41,10 +44,29 @@ async def retrieve_status(
     msisdn: str = Query(..., regex=rgx.MSISDN, example="7839921514")
 ) -> RetrieveStatusResponse:
     """Retrieve SIM status"""
-    sim_details = get_sim_details(msisdn)
+    sim_details = await get_sim_details(msisdn)
     return RetrieveStatusResponse(data=sim_details)
 
 
+@router.post(
+    "/status/batch",
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def retrieve_status_batch(
+    batch: BatchStatusRequest, session_msisdn=Depends(JWTBearer())
+) -> StreamingResponse:
+    """
+    Retrieve SIM status of up to `zend_batch_max_size` MSISDNs (duplicates
+    collapsed), for an authenticated caller.
+    Streams one RetrieveStatusResponse-like line per MSISDN (NDJSON), with its
+    `msisdn`, as soon as it completes.
+    """
+    return StreamingResponse(
+        stream_sim_details(batch.msisdns), media_type="application/x-ndjson"
+    )
+
+
 @router.get(
     "/subscriptions",
     response_model=SubscriptionsResponse,
@@ -56,7 +78,7 @@ async def retrieve_subscriptions(
     """Retrieve subscriptions list"""
     if msisdn != session_msisdn:
         raise ApiException(status.HTTP_401_UNAUTHORIZED, error=MSISDN_MISMATCH)
-    return SubscriptionsResponse(data=get_subscriptions(msisdn))
+    return SubscriptionsResponse(data=await get_subscriptions(msisdn))
 
 
 @router.get("/subaccounts", response_model=SubaccountsResponse)
@@ -67,7 +89,7 @@ async def retrieve_subaccounts(
     """Retrieves the subaccounts the customer has free units in and the amount in each subaccount."""
     if msisdn != session_msisdn:
         raise ApiException(status.HTTP_401_UNAUTHORIZED, error=MSISDN_MISMATCH)
-    return SubaccountsResponse(data=get_free_units(msisdn))
+    return SubaccountsResponse(data=await get_free_units(msisdn))
 
 
 @router.get(
@@ -81,7 +103,7 @@ async def retrieve_wallet(
     """Retrieve customer wallet's details (balance and load)"""
     if msisdn != session_msisdn:
         raise ApiException(status.HTTP_401_UNAUTHORIZED, error=MSISDN_MISMATCH)
-    return WalletResponse(data=get_wallet(msisdn))
+    return WalletResponse(data=await get_wallet(msisdn))
     # assert msisdn == session_msisdn
 
 
@@ -98,7 +120,7 @@ async def redeem_registration_gift(
         raise ApiException(
             status_code=status.HTTP_401_UNAUTHORIZED, error=MSISDN_MISMATCH
         )
-    return change_supplementary_offering(
+    return await change_supplementary_offering(
         msisdn, settings.registration_gift_offer_id, True
     )
 
@@ -111,9 +133,18 @@ async def charge_voucher(
     msisdn: str = Body(..., regex=rgx.MSISDN, example="7839921514"),
     pincode: str = Body(..., regex=rgx.VOUCHER_PINCODE, example="1234567891011121"),
     session_msisdn=Depends(JWTBearer()),
+    idempotency_key: str | None = Header(None, max_length=255),
 ) -> ApiResponse:
-    """Recharge the balance using a voucher"""
-    return recharge_voucher(msisdn, pincode)
+    """
+    Recharge the balance using a voucher.
+    Retries carrying the same `Idempotency-Key` header get the first response.
+    """
+    return await idempotent(
+        idempotency_key,
+        f"{session_msisdn}:charge-voucher",
+        {"msisdn": msisdn, "pincode": pincode},
+        lambda: recharge_voucher(msisdn, pincode),
+    )
 
 
 @router.get("/query-bill", response_model=ApiResponse)
@@ -124,7 +155,7 @@ async def query_postpaid_bill(
     """Returns a postpaid customer's balance"""
     if msisdn != session_msisdn:
         raise ApiException(status_code=99, error=MSISDN_MISMATCH)
-    return query_bill(msisdn)
+    return await query_bill(msisdn)
 
 
 @router.post("/subscribe", response_model=ApiResponse)
@@ -132,11 +163,17 @@ async def subscribe_an_offer(
     msisdn: str = Body(..., regex=rgx.MSISDN, example="7839921514"),
     offer_id: int = Body(..., example=1000),
     session_msisdn=Depends(JWTBearer()),
+    idempotency_key: str | None = Header(None, max_length=255),
 ) -> ApiResponse:
     """Add a subscription to a Zain customer’s line using the subscriber’s MSISDN."""
     if msisdn != session_msisdn:
         raise ApiException(status.HTTP_401_UNAUTHORIZED, MSISDN_MISMATCH)
-    return zend_change_subscription(msisdn, offer_id, True)
+    return await idempotent(
+        idempotency_key,
+        f"{session_msisdn}:subscribe",
+        {"msisdn": msisdn, "offer_id": offer_id},
+        lambda: zend_change_subscription(msisdn, offer_id, True),
+    )
 
 
 @router.delete("/unsubscribe", response_model=ApiResponse)
@@ -144,12 +181,18 @@ async def unsubscribe_an_offer(
     msisdn: str = Body(..., regex=rgx.MSISDN, example="7839921514"),
     offer_id: int = Body(..., example=1000),
     session_msisdn=Depends(JWTBearer()),
+    idempotency_key: str | None = Header(None, max_length=255),
 ) -> ApiResponse:
     # removes a subscription from a Zain customer’s line using its TOMS ID and the subscriber’s MSISDNN
     """Remove a subscription from a Zain customer’s line using the subscriber’s MSISDN."""
     if msisdn != session_msisdn:
         raise ApiException(status.HTTP_401_UNAUTHORIZED, MSISDN_MISMATCH)
-    return zend_change_subscription(msisdn, offer_id, False)
+    return await idempotent(
+        idempotency_key,
+        f"{session_msisdn}:unsubscribe",
+        {"msisdn": msisdn, "offer_id": offer_id},
+        lambda: zend_change_subscription(msisdn, offer_id, False),
+    )
 
 
 @router.get("/welcome-message", response_model=nbaResponse)
@@ -160,8 +203,20 @@ async def welcome_message(
     """Welcome message aka nba"""
     if msisdn != session_msisdn:
         raise ApiException(status.HTTP_401_UNAUTHORIZED, MSISDN_MISMATCH)
-    sim_status = zend_sim(msisdn)
-    nba = get_nba(
-        msisdn, sim_status["unified_sim_status"], is_4g_compatible(msisdn), sim_status
-    )
-    return nbaResponse(data={"nba": nba})
+    return nbaResponse(data={"nba": await get_welcome_message(msisdn)})
+
+
+@router.get("/home", response_model=HomeResponse, response_model_exclude_none=True)
+async def retrieve_home(
+    msisdn: str = Query(..., regex=rgx.MSISDN, example="7839921514"),
+    sections: list[HomeSection] = Query(list(HomeSection)),
+    session_msisdn=Depends(JWTBearer()),
+) -> HomeResponse:
+    """
+    Home screen in one call: status, wallet, subscriptions, subaccounts and
+    welcome message (all by default, or the requested `sections`).
+    Sections that fail are reported under `errors`, the others still load.
+    """
+    if msisdn != session_msisdn:
+        raise ApiException(status.HTTP_401_UNAUTHORIZED, MSISDN_MISMATCH)
+    return HomeResponse(data=await get_home(msisdn, sections))
@@ -0,0 +1,164 @@
+""" Second-level cache of zend responses, shared by the workers of a node """
+
+import asyncio
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from utils.settings import settings
+from utils.logger import logger
+
+
+class SharedCache(ABC):
+    """Raw response bodies keyed by zend url, expiring after a per-entry ttl"""
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        ...
+
+
+class SQLiteCache(SharedCache):
+    """
+    Node-local store, no external service needed. Keep the file on a
+    memory-backed filesystem (e.g. /dev/shm) so reads are served from the
+    page cache of the shared mmap.
+    """
+
+    purge_every = 1_000
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._sets = 0
+        self._db = sqlite3.connect(path, timeout=1, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=OFF")
+            self._db.execute(f"PRAGMA mmap_size={64 * 1024 * 1024}")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS zend_cache "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _get(self, key: str) -> bytes | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM zend_cache WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO zend_cache VALUES (?, ?, ?)",
+                (key, value, now + ttl),
+            )
+            self._sets += 1
+            if self._sets % self.purge_every == 0:
+                self._db.execute("DELETE FROM zend_cache WHERE expires_at <= ?", (now,))
+            self._db.commit()
+
+    def _delete(self, *keys: str) -> None:
+        with self._lock:
+            self._db.executemany(
+                "DELETE FROM zend_cache WHERE key = ?", [(key,) for key in keys]
+            )
+            self._db.commit()
+
+    async def get(self, key: str) -> bytes | None:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, *keys: str) -> None:
+        await asyncio.to_thread(self._delete, *keys)
+
+
+class RedisCache(SharedCache):
+    """Any Redis-compatible server, requires the optional `redis` package"""
+
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as aioredis
+        except ImportError as ex:
+            raise RuntimeError(
+                "zend_shared_cache=redis requires the `redis` package"
+            ) from ex
+        self._redis = aioredis.from_url(url)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._redis.set(key, value, px=int(ttl * 1000))
+
+    async def delete(self, *keys: str) -> None:
+        await self._redis.delete(*keys)
+
+
+_backends = {
+    "sqlite": lambda: SQLiteCache(settings.zend_shared_cache_path),
+    "redis": lambda: RedisCache(settings.zend_shared_cache_url),
+}
+_shared_cache: SharedCache | None = None
+
+
+def get_shared_cache() -> SharedCache | None:
+    """Configured backend (settings.zend_shared_cache) or None when disabled"""
+    global _shared_cache
+    if _shared_cache is None and settings.zend_shared_cache:
+        _shared_cache = _backends[settings.zend_shared_cache]()
+    return _shared_cache
+
+
+def endpoint_name(endpoint: str) -> str:
+    """e.g. esb/query-balance for {zend_api}esb/query-balance/"""
+    return endpoint.removeprefix(settings.zend_api).strip("/")
+
+
+def cache_key(endpoint: str, msisdn: str) -> str:
+    """Key of msisdn's response from endpoint, whatever the endpoint's slashes"""
+    return f"{settings.zend_api}{endpoint_name(endpoint)}/{msisdn}"
+
+
+def ttl_for(endpoint: str) -> float:
+    """Shared cache ttl of a zend endpoint, 0 when it isn't cached"""
+    return settings.zend_shared_cache_ttls.get(endpoint_name(endpoint), 0)
+
+
+async def load(key: str) -> bytes | None:
+    if cache := get_shared_cache():
+        try:
+            return await cache.get(key)
+        except Exception as ex:
+            logger.warning("Shared cache get failed: %s", ex)
+    return None
+
+
+async def store(key: str, value: bytes, ttl: float) -> None:
+    if cache := get_shared_cache():
+        try:
+            await cache.set(key, value, ttl)
+        except Exception as ex:
+            logger.warning("Shared cache set failed: %s", ex)
+
+
+async def evict(msisdn: str) -> None:
+    """Drop the cached responses of every endpoint for msisdn"""
+    if cache := get_shared_cache():
+        keys = [cache_key(name, msisdn) for name in settings.zend_shared_cache_ttls]
+        try:
+            await cache.delete(*keys)
+        except Exception as ex:
+            logger.warning("Shared cache delete failed: %s", ex)
@@ -1,5 +1,13 @@
+import asyncio
+from typing import AsyncIterator
 from pydantic import Field
 from pydantic.main import BaseModel
+from api.models.data import Error, Status
+from api.models.response import ApiException, ApiResponse
+from api.serialization import model_bytes
+from utils.settings import settings
+from .client import deadline_scope, gather
+from .sim_helper import get_nba
 from .zend import is_4g_compatible, zend_sim
 from api.user.repository import get_user
 
@@ -25,7 +33,7 @@ class Sim(BaseModel):
     associated_with_user: bool = False
 
 
-def get_sim_details(msisdn: str) -> Sim:
+async def get_sim_details(msisdn: str) -> Sim:
     """
     Gets info on the provided customer's SIM status incl.
     - Eligibility to use the application
@@ -33,11 +41,15 @@ def get_sim_details(msisdn: str) -> Sim:
 
     TODO Add WeWebit USIM service - prod. env only
     """
-    # fetch SIM status & USIM status (hardcode USIM in UAT)
-    backend_sim_status = zend_sim(msisdn)
+    # fetch SIM status, USIM status & user concurrently (hardcode USIM in UAT)
+    backend_sim_status, usim_status, user = await gather(
+        zend_sim(msisdn),
+        is_4g_compatible(msisdn),
+        get_user(msisdn),
+    )
 
     # get details
-    unified_sim_status = zend_sim(msisdn)["unified_sim_status"]
+    unified_sim_status = backend_sim_status["unified_sim_status"]
     # nba = get_nba(msisdn, unified_sim_status, usim_status, backend_sim_status)
 
     return Sim(
@@ -52,9 +64,56 @@ def get_sim_details(msisdn: str) -> Sim:
         subscriber_type=backend_sim_status["subscriber_type"],
         # injected info
         unified_sim_status=unified_sim_status,
-        is_4g_compatible=is_4g_compatible(msisdn),
+        is_4g_compatible=usim_status,
         is_eligible=False if "BLOCK" in unified_sim_status else True,
         # nba=nba,
         # user info
-        associated_with_user=get_user(msisdn) is not None,
+        associated_with_user=user is not None,
     )
+
+
+async def get_welcome_message(msisdn: str) -> str:
+    """Next best action (nba) to welcome the customer with"""
+    sim_status, usim_status = await gather(zend_sim(msisdn), is_4g_compatible(msisdn))
+    return get_nba(msisdn, sim_status["unified_sim_status"], usim_status, sim_status)
+
+
+class BatchStatusEntry(ApiResponse):
+    msisdn: str
+    data: Sim | None = None
+
+
+async def stream_sim_details(msisdns: list[str]) -> AsyncIterator[bytes]:
+    """
+    SIM details of each distinct msisdn as NDJSON lines, in completion order.
+    At most settings.zend_batch_concurrency msisdns are looked up at once.
+    """
+    semaphore = asyncio.Semaphore(settings.zend_batch_concurrency)
+
+    async def lookup(msisdn: str) -> BatchStatusEntry:
+        async with semaphore:
+            try:
+                # each msisdn gets its own deadline, the stream may outlive any
+                with deadline_scope(settings.zend_deadline, detached=True):
+                    sim = await get_sim_details(msisdn)
+                return BatchStatusEntry(msisdn=msisdn, data=sim)
+            except ApiException as ex:
+                return BatchStatusEntry(
+                    msisdn=msisdn, status=Status.failed, error=ex.error
+                )
+            except Exception as ex:
+                return BatchStatusEntry(
+                    msisdn=msisdn,
+                    status=Status.failed,
+                    error=Error(type="internal", code=99, message=str(ex)),
+                )
+
+    tasks = [asyncio.ensure_future(lookup(msisdn)) for msisdn in dict.fromkeys(msisdns)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            entry = await next_done
+            yield model_bytes(entry) + b"\n"
+    finally:
+        # client went away: stop the remaining lookups
+        for task in tasks:
+            task.cancel()
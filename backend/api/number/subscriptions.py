@@ -85,9 +85,9 @@ class Subscription(BaseModel):
         return "Invalid"
 
 
-def get_subscriptions(msisdn: str) -> list[Subscription]:
+async def get_subscriptions(msisdn: str) -> list[Subscription]:
     """Get subscriptions for the provided msisdn"""
-    raw_subscriptions = zend_subscriptions(msisdn)
+    raw_subscriptions = await zend_subscriptions(msisdn)
     """
     [ {
       "id": 991,
@@ -9,11 +9,11 @@ from .subscriptions import get_subscriptions
 msisdn = "96478"
 
 
-def test():
+async def test():
     return [
-        {"wallet": get_wallet(msisdn).dict()},
-        {"subscriptions": [one.dict() for one in get_subscriptions(msisdn)]},
-        {"sim": get_sim_details(msisdn).dict()},
+        {"wallet": (await get_wallet(msisdn)).dict()},
+        {"subscriptions": [one.dict() for one in await get_subscriptions(msisdn)]},
+        {"sim": (await get_sim_details(msisdn)).dict()},
     ]
 
 
@@ -1,10 +1,6 @@
 """ Zain backend services (aka zend) """
 
-import os
-import requests
-import requests_mock
 from typing import Any
-from pathlib import Path
 from api.models.response import ApiException, ApiResponse
 from api.number.subaccount import Subaccount
 from api.models.utils import api_exception, api_response
@@ -12,6 +8,15 @@ from api.models.data import Error
 from utils.settings import settings
 from fastapi import status
 from api.number import cms
+from api.number import client, mock_transport
+from api.number.memo import single_flight
+from api.number.cache import (
+    MISSING,
+    cached,
+    ineligible_cache,
+    invalidates,
+    stale_while_revalidate,
+)
 from .sim_helper import get_unified_sim_status
 
 zend_check_4g_api = f"{settings.zend_api}wewebit/query-usim-service/"
@@ -22,29 +27,33 @@ zend_recharge_voucher_api = f"{settings.zend_api}esb/recharge-voucher"
 zend_payment_voucher_api = f"{settings.zend_api}esb/payment-voucher"
 zend_subscriptions_api = f"{settings.zend_api}cbs/query-mgr-service/"
 zend_send_sms_api = f"{settings.zend_api}sms/send"
-zend_free_units_api = f"{settings.zend_api}esb/free-units"
+zend_free_units_api = f"{settings.zend_api}esb/free-units/"
 zend_change_supplementary_offering_api = (
     f"{settings.zend_api}esb/change-supplementary-offering"
 )
 zend_query_bill = f"{settings.zend_api}esb/billing-details/"
 
-path = f"{os.path.dirname(__file__)}/mocks/"
+mock_transport.routes.update(
+    {
+        zend_check_4g_api: "zend_query-usim-service.json",
+        zend_balance_api: "zend_balance.json",
+        zend_sim_api: "zend_sim.json",
+        zend_recharge_voucher_api: "zend_recharge_voucher.json",
+        zend_payment_voucher_api: "zend_recharge_voucher.json",
+        zend_subscriptions_api: "zend_mgr_service.json",
+        zend_send_sms_api: "zend_sms_sent.json",
+        zend_free_units_api: "zand_free_units.json",
+        zend_change_supplementary_offering_api: "zend_change_supplementary_offering.json",
+        zend_query_bill: "query_bill.json",
+    }
+)
 
-headers = {"Content-Type": "application/json"}
 
+@single_flight
+async def get_free_units(msisdn: str) -> list[Subaccount]:
+    response = await client.get(zend_free_units_api, msisdn)
 
-def get_free_units(msisdn: str) -> list[Subaccount]:
-    if settings.mock_zain_api:
-        with requests_mock.Mocker() as m:
-            m.get(
-                f"{zend_free_units_api}/{msisdn}",
-                text=Path(f"{path}./zand_free_units.json").read_text(),
-            )
-            response = requests.get(f"{zend_free_units_api}/{msisdn}")
-    else:
-        response = requests.get(f"{zend_free_units_api}/{msisdn}")
-
-    if not response.ok:
+    if not response.is_success:
         raise api_exception(response)
 
     free_units: list[Subaccount] = []
@@ -61,7 +70,8 @@ def get_free_units(msisdn: str) -> list[Subaccount]:
     return free_units
 
 
-def change_supplementary_offering(
+@invalidates
+async def change_supplementary_offering(
     msisdn: str, offer_id: str, add_offering: bool
 ) -> ApiResponse:
     request_data = {
@@ -69,29 +79,14 @@ def change_supplementary_offering(
         "offer_id": offer_id,
         "add_offering": add_offering,
     }
-    if settings.mock_zain_api:
-        with requests_mock.Mocker() as m:
-            m.post(
-                zend_change_supplementary_offering_api,
-                text=Path(
-                    f"{path}./zend_change_supplementary_offering.json"
-                ).read_text(),
-            )
-            response = requests.post(
-                zend_change_supplementary_offering_api,
-                headers=headers,
-                json=request_data,
-            )
-    else:
-        response = requests.post(
-            zend_change_supplementary_offering_api, headers=headers, json=request_data
-        )
-    if not response.ok:
+    response = await client.post(zend_change_supplementary_offering_api, request_data)
+    if not response.is_success:
         raise api_exception(response)
     return api_response(response)
 
 
-def recharge_voucher(msisdn: str, pin: str) -> ApiResponse:
+@invalidates
+async def recharge_voucher(msisdn: str, pin: str) -> ApiResponse:
     request_data = {"msisdn": msisdn, "pincode": pin}
 
     not_eligible_exception = ApiException(
@@ -103,7 +98,7 @@ def recharge_voucher(msisdn: str, pin: str) -> ApiResponse:
         ),
     )
 
-    backend_sim_status = zend_sim(msisdn)
+    backend_sim_status = await zend_sim(msisdn)
 
     if backend_sim_status.get("subscriber_type") not in [0, 1]:
         raise not_eligible_exception
@@ -117,68 +112,35 @@ def recharge_voucher(msisdn: str, pin: str) -> ApiResponse:
     else:
         raise not_eligible_exception
 
-    if settings.mock_zain_api:
-        with requests_mock.Mocker() as m:
-            m.post(
-                url,
-                text=Path(f"{path}./zend_recharge_voucher.json").read_text(),
-            )
-            response = requests.post(url, headers=headers, json=request_data)
-    else:
-        response = requests.post(url, headers=headers, json=request_data)
-    if not response.ok:
+    response = await client.post(url, request_data)
+    if not response.is_success:
         raise api_exception(response)
     return api_response(response)
 
 
-def zend_send_sms(msisdn: str, message: str) -> dict:
-    if settings.mock_zain_api:
-        with requests_mock.Mocker() as m:
-            m.post(
-                zend_send_sms_api, text=Path(f"{path}./zend_sms_sent.json").read_text()
-            )
-            response = requests.post(
-                zend_send_sms_api,
-                headers=headers,
-                json={"msisdn": msisdn, "message": message},
-            )
-    else:
-        response = requests.post(
-            zend_send_sms_api,
-            headers=headers,
-            json={"msisdn": msisdn, "message": message},
-        )
-    if not response.ok:
+async def zend_send_sms(msisdn: str, message: str) -> dict:
+    response = await client.post(
+        zend_send_sms_api, {"msisdn": msisdn, "message": message}
+    )
+    if not response.is_success:
         raise api_exception(response)
     return response.json().get("data")
 
 
-def zend_balance(msisdn: str) -> dict[str, Any]:
-    if settings.mock_zain_api:
-        with requests_mock.Mocker() as m:
-            m.get(
-                zend_balance_api + msisdn,
-                text=Path(f"{path}./zend_balance.json").read_text(),
-            )
-            response = requests.get(zend_balance_api + msisdn)
-    else:
-        response = requests.get(zend_balance_api + msisdn)  # , json={"msisdn": msisdn})
-    if not response.ok:
+@single_flight
+async def zend_balance(msisdn: str) -> dict[str, Any]:
+    response = await client.get(zend_balance_api, msisdn)
+    if not response.is_success:
         raise api_exception(response)
     return response.json().get("data")
 
 
-def zend_sim(msisdn: str) -> dict[str, Any]:
-    if settings.mock_zain_api:
-        with requests_mock.Mocker() as m:
-            m.get(
-                zend_sim_api + msisdn, text=Path(f"{path}./zend_sim.json").read_text()
-            )
-            response = requests.get(zend_sim_api + msisdn)  # , json={"msisdn": msisdn})
-    else:
-        response = requests.get(zend_sim_api + msisdn)  # , json={"msisdn": msisdn})
+@single_flight
+@cached
+async def zend_sim(msisdn: str) -> dict[str, Any]:
+    response = await client.get(zend_sim_api, msisdn)
 
-    if not response.ok:
+    if not response.is_success:
         raise api_exception(response)
 
     backend_sim_status = response.json().get("data")
@@ -209,78 +171,51 @@ def zend_sim(msisdn: str) -> dict[str, Any]:
     return backend_sim_status
 
 
-def zend_subscriptions(msisdn: str) -> list[dict[str, Any]]:
-    if settings.mock_zain_api:
-        with requests_mock.Mocker() as m:
-            m.get(
-                zend_subscriptions_api + msisdn,
-                text=Path(f"{path}./zend_mgr_service.json").read_text(),
-            )
-            response = requests.get(zend_subscriptions_api + msisdn)
-    else:
-        response = requests.get(zend_subscriptions_api + msisdn)
-    if not response.ok:
+async def zend_is_eligible(msisdn: str) -> bool:
+    """
+    is_eligible of zend_sim. Ineligible msisdns are remembered (with their
+    unified_sim_status) so repeated rejections don't reach the Zain backend.
+    """
+    if ineligible_cache.get(msisdn) is not MISSING:
+        return False
+    backend_sim_status = await zend_sim(msisdn)
+    if not backend_sim_status["is_eligible"]:
+        ineligible_cache.set(msisdn, backend_sim_status["unified_sim_status"])
+    return backend_sim_status["is_eligible"]
+
+
+@single_flight
+async def zend_subscriptions(msisdn: str) -> list[dict[str, Any]]:
+    response = await client.get(zend_subscriptions_api, msisdn)
+    if not response.is_success:
         raise api_exception(response)
     return response.json().get("data").get("subscriptions")
 
 
-def query_bill(msisdn: str) -> ApiResponse:
-    if settings.mock_zain_api:
-        with requests_mock.Mocker() as m:
-            m.get(
-                zend_query_bill + msisdn,
-                text=Path(f"{path}./query_bill.json").read_text(),
-            )
-            response = requests.get(zend_query_bill + msisdn)
-    else:
-        response = requests.get(zend_query_bill + msisdn)
-    if not response.ok:
+@single_flight
+async def query_bill(msisdn: str) -> ApiResponse:
+    response = await client.get(zend_query_bill, msisdn)
+    if not response.is_success:
         raise api_exception(response)
     return api_response(response)
 
 
-def zend_change_subscription(
+@invalidates
+async def zend_change_subscription(
     msisdn: str, offer_id: int, subscribe: bool
 ) -> ApiResponse:
     request_data = {"msisdn": msisdn, "offer_id": offer_id, "add_offering": subscribe}
 
-    if settings.mock_zain_api:
-        mock_path = f"{path}./zend_change_supplementary_offering.json"
-        with requests_mock.Mocker() as m:
-            m.post(
-                zend_change_supplementary_offering_api,
-                text=Path(mock_path).read_text(),
-            )
-            response = requests.post(
-                zend_change_supplementary_offering_api,
-                headers=headers,
-                json=request_data,
-            )
-    else:
-        response = requests.post(
-            zend_change_supplementary_offering_api, headers=headers, json=request_data
-        )
+    response = await client.post(zend_change_supplementary_offering_api, request_data)
 
-    if not response.ok:
+    if not response.is_success:
         raise api_exception(response)
     return api_response(response)
 
 
-def is_4g_compatible(msisdn: str) -> bool:
-
-    if settings.mock_zain_api:
-        mock_path = f"{path}./zend_query-usim-service.json"
-        with requests_mock.Mocker() as m:
-            m.post(
-                zend_check_4g_api,
-                text=Path(mock_path).read_text(),
-            )
-            response = requests.post(
-                zend_check_4g_api,
-                headers=headers,
-            )
-            return response.json().get("data").get("is_4g_compatible")
-
-    response = requests.get(zend_check_4g_api + msisdn)
+@single_flight
+@stale_while_revalidate
+async def is_4g_compatible(msisdn: str) -> bool:
+    response = await client.get(zend_check_4g_api, msisdn)
 
     return response.json().get("data").get("is_4g_compatible")
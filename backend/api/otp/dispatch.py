@@ -0,0 +1,43 @@
+""" OTP side effects (sms, slack) sent in the background """
+
+import asyncio
+from api.number.zend import zend_send_sms
+from utils.dispatch import WorkQueue
+from utils.settings import settings
+from .utils import close_slack_client, slack_notify
+
+
+async def send_sms(messages: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """Send (msisdn, message) pairs concurrently, returns the failed ones"""
+    results = await asyncio.gather(
+        *(zend_send_sms(msisdn, message) for msisdn, message in messages),
+        return_exceptions=True,
+    )
+    return [
+        item for item, result in zip(messages, results) if isinstance(result, Exception)
+    ]
+
+
+sms_queue = WorkQueue(
+    "sms",
+    send_sms,
+    settings.dispatch_queue_size,
+    settings.dispatch_batch_size,
+    settings.dispatch_max_attempts,
+)
+slack_queue = WorkQueue(
+    "slack",
+    slack_notify,
+    settings.dispatch_queue_size,
+    settings.dispatch_batch_size,
+    settings.dispatch_max_attempts,
+)
+
+
+async def drain() -> None:
+    """Flush pending notifications, called on application shutdown"""
+    await asyncio.gather(
+        sms_queue.drain(settings.dispatch_drain_timeout),
+        slack_queue.drain(settings.dispatch_drain_timeout),
+    )
+    await close_slack_client()
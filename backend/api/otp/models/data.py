@@ -3,3 +3,12 @@ from pydantic import BaseModel, Field
 
 class Confirmation(BaseModel):
     confirmation: str = Field(..., example="fjuGQYmZvCBsQbEZ")
+
+
+class StoredOtp(BaseModel):
+    """An issued otp, as kept by the otp store"""
+
+    msisdn: str
+    code: str
+    confirmation: str | None = None
+    tries: int = 0
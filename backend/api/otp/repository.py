@@ -1,41 +1,89 @@
-from db.main import SessionLocal
+"""
+DB Operations for the otp package model, each one a single statement (one
+round trip) that is safe under concurrent requests for the same msisdn.
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from db.main import transaction
 from db.models import Otp
+from utils.settings import settings
 from .utils import gen_alphanumeric
 
 
-def create_otp(msisdn: str, code: str, confirmation: str | None = None) -> Otp:
-    with SessionLocal() as session:
-        otp = Otp(msisdn=msisdn, code=code)
-        if confirmation:
-            otp.confirmation = confirmation
-        session.add(otp)
-        session.commit()
-        session.refresh(otp)
+def _issued_after() -> datetime:
+    """Otps issued before are expired"""
+    return datetime.utcnow() - timedelta(seconds=settings.otp_ttl)
+
+
+async def create_otp(msisdn: str, code: str, confirmation: str | None = None) -> None:
+    """Issue an otp, replacing (and resetting the tries of) any prior one"""
+    now = datetime.utcnow()
+    values = {
+        "code": code,
+        "confirmation": confirmation,
+        "tries": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    async with transaction() as session:
+        await session.execute(
+            insert(Otp)
+            .values(msisdn=msisdn, **values)
+            .on_conflict_do_update(index_elements=[Otp.msisdn], set_=values)
+        )
+
+
+async def get_otp(msisdn: str) -> Otp | None:
+    async with transaction() as session:
+        result = await session.execute(
+            select(Otp).where(Otp.msisdn == msisdn, Otp.created_at > _issued_after())
+        )
+        return result.scalars().first()
 
 
-def get_otp(msisdn: str) -> Otp | None:
-    with SessionLocal() as session:
-        return session.query(Otp).filter(Otp.msisdn == msisdn).first()
+async def delete_otp(msisdn: str) -> None:
+    async with transaction() as session:
+        await session.execute(delete(Otp).where(Otp.msisdn == msisdn))
 
 
-def delete_otp(msisdn: str) -> None:
-    with SessionLocal() as session:
-        if otp := get_otp(msisdn):
-            session.delete(otp)
-            session.commit()
+async def confirm_otp_code(msisdn: str, code: str) -> str | None:
+    """
+    Count an attempt and, when code matches, set a new confirmation.
+    Returns the confirmation, None for a wrong code or no otp.
+    """
+    async with transaction() as session:
+        result = await session.execute(
+            update(Otp)
+            .where(Otp.msisdn == msisdn, Otp.created_at > _issued_after())
+            .values(
+                tries=Otp.tries + 1,
+                confirmation=case(
+                    (Otp.code == code, gen_alphanumeric()), else_=Otp.confirmation
+                ),
+                updated_at=datetime.utcnow(),
+            )
+            .returning(Otp.confirmation, Otp.code == code)
+            .execution_options(synchronize_session=False)
+        )
+        row = result.first()
+    return row[0] if row and row[1] else None
 
 
-def increment_otp_tries(otp: Otp) -> None:
-    with SessionLocal() as session:
-        otp.tries += 1
-        session.add(otp)
-        session.commit()
-        session.refresh(otp)
+async def is_otp_confirmed(msisdn: str, confirmation: str) -> bool:
+    """Whether msisdn's otp was confirmed with this confirmation"""
+    async with transaction() as session:
+        result = await session.execute(
+            select(Otp.msisdn).where(
+                Otp.msisdn == msisdn,
+                Otp.confirmation == confirmation,
+                Otp.created_at > _issued_after(),
+            )
+        )
+        return result.first() is not None
 
 
-def gen_otp_confirmation(otp: Otp) -> None:
-    with SessionLocal() as session:
-        otp.confirmation = gen_alphanumeric()
-        session.add(otp)
-        session.commit()
-        session.refresh(otp)
+async def delete_expired_otps() -> None:
+    async with transaction() as session:
+        await session.execute(delete(Otp).where(Otp.created_at <= _issued_after()))
@@ -3,8 +3,7 @@
 from fastapi import APIRouter, status
 from api.models.response import ApiResponse
 from api.models.errors import ELIGIBILITY_ERR
-from .utils import slack_notify
-from api.number.zend import zend_send_sms, zend_sim
+from api.number.zend import zend_is_eligible
 from api.models.response import ApiException
 from api.otp.models import examples
 from api.otp.models.errors import INVALID_CONFIRMATION, INVALID_OTP
@@ -14,15 +13,11 @@ from api.otp.models.request import (
     VerifyOTPRequest,
 )
 from api.otp.models.response import Confirmation, ConfirmationResponse
-from .repository import (
-    create_otp,
-    get_otp,
-    delete_otp,
-    increment_otp_tries,
-    gen_otp_confirmation,
-)
+from api.serialization import FastRoute
+from .dispatch import slack_queue, sms_queue
+from .store import get_otp_store
 
-router = APIRouter()
+router = APIRouter(route_class=FastRoute)
 
 
 @router.post(
@@ -33,14 +28,14 @@ router = APIRouter()
 )
 async def send_otp(user_request: SendOTPRequest) -> ApiResponse:
     """Request new OTP"""
-    if not zend_sim(user_request.msisdn)["is_eligible"]:
+    if not await zend_is_eligible(user_request.msisdn):
         raise ApiException(status.HTTP_403_FORBIDDEN, error=ELIGIBILITY_ERR)
-    # If a prior otp exists, delete it.
-    delete_otp(user_request.msisdn)
     code = "123456"  # gen_numeric()  # FIXME on production
-    create_otp(user_request.msisdn, code)
-    zend_send_sms(user_request.msisdn, f"Your otp code is {code}")
-    slack_notify(user_request.msisdn, code)
+    # replaces any prior otp of the msisdn
+    await get_otp_store().create(user_request.msisdn, code)
+    # sent after the response, retried in the background
+    sms_queue.submit((user_request.msisdn, f"Your otp code is {code}"))
+    slack_queue.submit((user_request.msisdn, code))
     return ApiResponse()
 
 
@@ -52,13 +47,9 @@ async def send_otp(user_request: SendOTPRequest) -> ApiResponse:
 )
 async def confirm_otp(user_request: ConfirmOTPRequest) -> ConfirmationResponse:
     """Confirm OTP"""
-    if otp := get_otp(user_request.msisdn):
-        increment_otp_tries(otp)
-        if otp.code == user_request.code:
-            gen_otp_confirmation(otp)
-            return ConfirmationResponse(
-                data=Confirmation(confirmation=otp.confirmation),
-            )
+    otp_store = get_otp_store()
+    if confirmation := await otp_store.confirm(user_request.msisdn, user_request.code):
+        return ConfirmationResponse(data=Confirmation(confirmation=confirmation))
     raise ApiException(status.HTTP_400_BAD_REQUEST, INVALID_OTP)
 
 
@@ -70,7 +61,7 @@ async def confirm_otp(user_request: ConfirmOTPRequest) -> ConfirmationResponse:
 )
 async def verify_otp(user_request: VerifyOTPRequest) -> ApiResponse:
     """Verify the confirmation of OTP"""
-    otp = get_otp(user_request.msisdn)
-    if otp and otp.confirmation and otp.confirmation == user_request.confirmation:
+    otp_store = get_otp_store()
+    if await otp_store.is_confirmed(user_request.msisdn, user_request.confirmation):
         return ApiResponse()
     raise ApiException(status.HTTP_400_BAD_REQUEST, INVALID_CONFIRMATION)
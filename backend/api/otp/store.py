@@ -0,0 +1,210 @@
+""" Where otps live between request, confirm & verify (settings.otp_store) """
+
+import asyncio
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from utils.settings import settings
+from utils.logger import logger
+from . import repository
+from .models.data import StoredOtp
+from .utils import gen_alphanumeric
+
+
+class OtpStore(ABC):
+    """Otps keyed by msisdn, expiring settings.otp_ttl seconds after issue"""
+
+    @abstractmethod
+    async def create(
+        self, msisdn: str, code: str, confirmation: str | None = None
+    ) -> None:
+        """Issue an otp, replacing (and resetting the tries of) any prior one"""
+        ...
+
+    @abstractmethod
+    async def get(self, msisdn: str) -> StoredOtp | None:
+        ...
+
+    @abstractmethod
+    async def delete(self, msisdn: str) -> None:
+        ...
+
+    @abstractmethod
+    async def confirm(self, msisdn: str, code: str) -> str | None:
+        """
+        Count an attempt and, when code matches, set a new confirmation.
+        Returns the confirmation, None for a wrong code or no otp.
+        """
+        ...
+
+    @abstractmethod
+    async def is_confirmed(self, msisdn: str, confirmation: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def sweep(self) -> None:
+        """Drop expired otps (they are already ignored on read)"""
+        ...
+
+
+class SQLOtpStore(OtpStore):
+    """The otp table of the application database"""
+
+    async def create(
+        self, msisdn: str, code: str, confirmation: str | None = None
+    ) -> None:
+        await repository.create_otp(msisdn, code, confirmation)
+
+    async def get(self, msisdn: str) -> StoredOtp | None:
+        if otp := await repository.get_otp(msisdn):
+            return StoredOtp(
+                msisdn=otp.msisdn,
+                code=otp.code,
+                confirmation=otp.confirmation,
+                tries=otp.tries,
+            )
+        return None
+
+    async def delete(self, msisdn: str) -> None:
+        await repository.delete_otp(msisdn)
+
+    async def confirm(self, msisdn: str, code: str) -> str | None:
+        return await repository.confirm_otp_code(msisdn, code)
+
+    async def is_confirmed(self, msisdn: str, confirmation: str) -> bool:
+        return await repository.is_otp_confirmed(msisdn, confirmation)
+
+    async def sweep(self) -> None:
+        await repository.delete_expired_otps()
+
+
+class MemoryOtpStore(OtpStore):
+    """
+    Node-local store shared by the workers, no database round trips. Keep
+    the file on a memory-backed filesystem (e.g. /dev/shm), as for the
+    zend shared cache. Otps are lost on reboot, which their ttl allows.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=1, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=OFF")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS otp (msisdn TEXT PRIMARY KEY, "
+                "code TEXT NOT NULL, confirmation TEXT, tries INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _create(self, msisdn: str, code: str, confirmation: str | None) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO otp VALUES (?, ?, ?, 0, ?)",
+                (msisdn, code, confirmation, time.time() + settings.otp_ttl),
+            )
+            self._db.commit()
+
+    def _get(self, msisdn: str) -> StoredOtp | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT msisdn, code, confirmation, tries FROM otp "
+                "WHERE msisdn = ? AND expires_at > ?",
+                (msisdn, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        msisdn, code, confirmation, tries = row
+        return StoredOtp(
+            msisdn=msisdn, code=code, confirmation=confirmation, tries=tries
+        )
+
+    def _delete(self, msisdn: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM otp WHERE msisdn = ?", (msisdn,))
+            self._db.commit()
+
+    def _confirm(self, msisdn: str, code: str) -> str | None:
+        with self._lock:
+            row = self._db.execute(
+                "UPDATE otp SET tries = tries + 1, confirmation = "
+                "CASE WHEN code = ? THEN ? ELSE confirmation END "
+                "WHERE msisdn = ? AND expires_at > ? "
+                "RETURNING confirmation, code = ?",
+                (code, gen_alphanumeric(), msisdn, time.time(), code),
+            ).fetchone()
+            self._db.commit()
+        return row[0] if row and row[1] else None
+
+    def _is_confirmed(self, msisdn: str, confirmation: str) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM otp "
+                "WHERE msisdn = ? AND confirmation = ? AND expires_at > ?",
+                (msisdn, confirmation, time.time()),
+            ).fetchone()
+        return row is not None
+
+    def _sweep(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM otp WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    async def create(
+        self, msisdn: str, code: str, confirmation: str | None = None
+    ) -> None:
+        await asyncio.to_thread(self._create, msisdn, code, confirmation)
+
+    async def get(self, msisdn: str) -> StoredOtp | None:
+        return await asyncio.to_thread(self._get, msisdn)
+
+    async def delete(self, msisdn: str) -> None:
+        await asyncio.to_thread(self._delete, msisdn)
+
+    async def confirm(self, msisdn: str, code: str) -> str | None:
+        return await asyncio.to_thread(self._confirm, msisdn, code)
+
+    async def is_confirmed(self, msisdn: str, confirmation: str) -> bool:
+        return await asyncio.to_thread(self._is_confirmed, msisdn, confirmation)
+
+    async def sweep(self) -> None:
+        await asyncio.to_thread(self._sweep)
+
+
+_backends = {
+    "sql": SQLOtpStore,
+    "memory": lambda: MemoryOtpStore(settings.otp_store_path),
+}
+_otp_store: OtpStore | None = None
+_sweeper: asyncio.Task | None = None
+
+
+def get_otp_store() -> OtpStore:
+    """Configured backend (settings.otp_store)"""
+    global _otp_store
+    if _otp_store is None:
+        _otp_store = _backends[settings.otp_store]()
+    return _otp_store
+
+
+async def _sweep_forever() -> None:
+    while True:
+        await asyncio.sleep(settings.otp_sweep_interval)
+        try:
+            await get_otp_store().sweep()
+        except Exception as ex:
+            logger.warning("Otp sweep failed: %s", ex)
+
+
+def start_sweeper() -> None:
+    """Periodically drop expired otps, called on application startup"""
+    global _sweeper
+    if _sweeper is None or _sweeper.done():
+        _sweeper = asyncio.create_task(_sweep_forever())
+
+
+def stop_sweeper() -> None:
+    if _sweeper is not None:
+        _sweeper.cancel()
@@ -1,10 +1,12 @@
+import asyncio
 import random
 import string
-import json
-import sys
-import requests
+import httpx
 from utils.settings import settings
 
+_slack_client: httpx.AsyncClient | None = None
+_slack_client_loop: asyncio.AbstractEventLoop | None = None
+
 
 def gen_alphanumeric(length=16):
     return "".join(
@@ -16,11 +18,39 @@ def gen_numeric(length=6):
     return "".join(random.choice(string.digits) for _ in range(length))
 
 
-def slack_notify(msisdn: str, code: str):
+def _get_slack_client() -> httpx.AsyncClient:
+    """Keep-alive client for the slack webhook, one per event loop"""
+    global _slack_client, _slack_client_loop
+    loop = asyncio.get_running_loop()
+    if (
+        _slack_client is None
+        or _slack_client.is_closed
+        or _slack_client_loop is not loop
+    ):
+        _slack_client = httpx.AsyncClient(timeout=10)
+        _slack_client_loop = loop
+    return _slack_client
+
+
+async def close_slack_client() -> None:
+    """Release pooled connections, called on application shutdown"""
+    global _slack_client, _slack_client_loop
+    if _slack_client is not None and not _slack_client.is_closed:
+        await _slack_client.aclose()
+    _slack_client = None
+    _slack_client_loop = None
+
+
+async def slack_notify(otps: list[tuple[str, str]]) -> list[tuple[str, str]]:
+    """
+    Post (msisdn, code) pairs as one slack message. The batch succeeds or
+    fails as a whole: nothing is returned as failed, an error is raised so
+    that the WorkQueue retries every pair.
+    """
 
     # If no webhook is configured, do nothing.
     if not settings.slack_webhook_url or not settings.slack_notify:
-        return
+        return []
 
     slack_data = {
         "username": "Galleon",
@@ -34,16 +64,14 @@ def slack_notify(msisdn: str, code: str):
                         "value": f"Otp code `{code}` for msisdn `{msisdn}`",
                         "short": "true",
                     }
+                    for msisdn, code in otps
                 ],
             }
         ],
     }
-    byte_length = str(sys.getsizeof(slack_data))
-    headers = {"Content-Type": "application/json", "Content-Length": byte_length}
-    response = requests.post(
-        settings.slack_webhook_url, data=json.dumps(slack_data), headers=headers
+    response = await _get_slack_client().post(
+        settings.slack_webhook_url, json=slack_data
     )
-    # print(json.dumps(slack_data))
-    # print(response.text)
     if response.status_code != 200:
         raise Exception(response.status_code, response.text)
+    return []
@@ -0,0 +1,123 @@
+""" Request/response (de)serialization, opt-in orjson fast path (settings.fast_json) """
+
+import asyncio
+import functools
+import json
+from decimal import Decimal
+from typing import Any, Callable, Coroutine
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from db.main import unit_of_work
+from utils.settings import settings
+
+try:
+    import orjson
+except ImportError:  # optional, only needed with settings.fast_json
+    orjson = None
+
+if settings.fast_json and orjson is None:
+    raise RuntimeError("FAST_JSON requires orjson to be installed")
+
+
+def _default(value: Any) -> Any:
+    """Types orjson does not serialize natively"""
+    if isinstance(value, BaseModel):
+        return value.dict(exclude_none=True)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def loads(data: bytes) -> Any:
+    return orjson.loads(data) if settings.fast_json else json.loads(data)
+
+
+def model_bytes(model: BaseModel) -> bytes:
+    """JSON bytes of a response model (None fields left out, as ApiResponse does)"""
+    if settings.fast_json:
+        return dumps(model.dict(exclude_none=True))
+    return model.json(exclude_none=True).encode()
+
+
+class ORJSONResponse(JSONResponse):
+    """Default response class in fast mode, for json-able content"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class ModelResponse(Response):
+    """A response model rendered straight to bytes, without jsonable_encoder"""
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        model: BaseModel,
+        status_code: int = 200,
+        headers: dict[str, str] | None = None,
+    ):
+        super().__init__(model, status_code, headers)
+
+    def render(self, content: BaseModel) -> bytes:
+        return model_bytes(content)
+
+
+class BodyRequest(Request):
+    """
+    Request whose json body is decoded with loads, so with orjson in fast mode.
+    Starlette already caches the body and its json, only the decoder differs.
+    """
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = loads(await self.body())
+        return self._json
+
+
+def _direct(
+    endpoint: Callable[..., Coroutine[Any, Any, Any]], status_code: int | None
+) -> Callable[..., Coroutine[Any, Any, Any]]:
+    @functools.wraps(endpoint)
+    async def direct(*args, **kwargs):
+        content = await endpoint(*args, **kwargs)
+        if isinstance(content, BaseModel):
+            return ModelResponse(content, status_code or 200)
+        return content
+
+    return direct
+
+
+class FastRoute(APIRoute):
+    """
+    Route class of the api routers. Routes get a BodyRequest, so a json body
+    is decoded by orjson in fast mode, and run in a database unit of work
+    committed before the response is sent.
+
+    In fast mode, a model returned by an async endpoint is answered as a
+    ModelResponse: FastAPI's response_model re-validation and jsonable_encoder
+    are skipped, so endpoints must return the declared model (still used for
+    the docs).
+    """
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        if settings.fast_json and asyncio.iscoroutinefunction(endpoint):
+            endpoint = _direct(endpoint, kwargs.get("status_code"))
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            async with unit_of_work():
+                return await handler(BodyRequest(request.scope, request.receive))
+
+        return route_handler
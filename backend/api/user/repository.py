@@ -1,64 +1,65 @@
 """DB Operations for the user package model"""
 
-from db.main import SessionLocal
+import asyncio
+from sqlalchemy import select
+from db.main import transaction
 from db.models import User
 from utils.password_hashing import hash_password
 from .models.request import UserCreateRequest
 
 
-def create_user(new_user: UserCreateRequest) -> User:
-    with SessionLocal() as session:
+async def create_user(new_user: UserCreateRequest) -> User:
+    password = await asyncio.to_thread(hash_password, new_user.password)
+    async with transaction() as session:
         user = User(
             msisdn=new_user.msisdn,
             name=new_user.name,
-            password=hash_password(new_user.password),
+            password=password,
             email=new_user.email,
             profile_pic_url=new_user.profile_pic_url,
         )
         session.add(user)
-        session.commit()
-        session.refresh(user)
+        await session.flush()
+        await session.refresh(user)
         return user
 
 
-def get_user(msisdn: str) -> User | None:
+async def get_user(msisdn: str) -> User | None:
     """Retrieve user by msisdn"""
-    with SessionLocal() as session:
-        return session.query(User).filter(User.msisdn == msisdn).first()
+    async with transaction() as session:
+        result = await session.execute(select(User).where(User.msisdn == msisdn))
+        return result.scalars().first()
 
 
-def update_user_password(user: User, password: str) -> None:
-    with SessionLocal() as session:
-        user.password = hash_password(password)
+async def update_user_password(user: User, password: str) -> None:
+    # bcrypt is slow on purpose, keep it off the event loop
+    user.password = await asyncio.to_thread(hash_password, password)
+    async with transaction() as session:
         session.add(user)
-        session.commit()
 
 
-def update_user(user: User, user_profile: UserCreateRequest) -> User:
+async def update_user(user: User, user_profile: UserCreateRequest) -> User:
     for key, value in user_profile.dict(exclude_none=True).items():
         setattr(user, key, value)
-    with SessionLocal() as session:
+    async with transaction() as session:
         session.add(user)
-        session.commit()
-        session.refresh(user)
+        await session.flush()
+        await session.refresh(user)
         return user
 
 
-def delete_user(user: User) -> None:
-    with SessionLocal() as session:
-        session.delete(user)
-        session.commit()
+async def delete_user(user: User) -> None:
+    async with transaction() as session:
+        await session.delete(user)
 
 
-def update_user_refresh_token(user: User, refresh_token: str) -> None:
-    with SessionLocal() as session:
+async def update_user_refresh_token(user: User, refresh_token: str) -> None:
+    async with transaction() as session:
         user.refresh_token = refresh_token
         session.add(user)
-        session.commit()
 
 
-def delete_user_refresh_token(user: User) -> None:
-    with SessionLocal() as session:
+async def delete_user_refresh_token(user: User) -> None:
+    async with transaction() as session:
         user.refresh_token = None
         session.add(user)
-        session.commit()
@@ -1,11 +1,12 @@
 """ User management apis """
 
+import asyncio
 from fastapi import APIRouter, Body, Header, status, Depends
 from sqlalchemy.orm import Session
 from typing import Optional
 from api.models.response import ApiResponse
 from utils.jwt import decode_jwt, sign_jwt
-from db.models import User, Otp
+from db.models import User
 from utils.password_hashing import verify_password
 import utils.regex as rgx
 from utils.jwt import JWTBearer
@@ -27,7 +28,9 @@ from api.user.models.response import (
 )
 from api.user.models import examples
 import api.user.models.errors as err
-from api.number.zend import zend_sim, is_4g_compatible
+from api.number.client import gather
+from api.serialization import FastRoute
+from api.number.zend import zend_is_eligible, zend_sim, is_4g_compatible
 from .repository import (
     get_user,
     create_user,
@@ -37,9 +40,9 @@ from .repository import (
     update_user_refresh_token,
     delete_user_refresh_token,
 )
-from api.otp.repository import get_otp
+from api.otp.store import get_otp_store
 
-router = APIRouter()
+router = APIRouter(route_class=FastRoute)
 
 
 @router.post(
@@ -50,17 +53,17 @@ router = APIRouter()
 )
 async def register_user(new_user: UserCreateRequest) -> UserProfileResponse:
     """Register a new user"""
-    if not zend_sim(new_user.msisdn)["is_eligible"]:
+    if not await zend_is_eligible(new_user.msisdn):
         raise ApiException(status.HTTP_403_FORBIDDEN, error=ELIGIBILITY_ERR)
-    user = get_user(new_user.msisdn)
+    user = await get_user(new_user.msisdn)
     if user:
         raise ApiException(status.HTTP_403_FORBIDDEN, err.USER_EXISTS)
 
-    otp = get_otp(new_user.msisdn)
-    if not (otp and otp.confirmation and otp.confirmation == new_user.otp_confirmation):
+    otp_store = get_otp_store()
+    if not await otp_store.is_confirmed(new_user.msisdn, new_user.otp_confirmation):
         raise ApiException(status.HTTP_409_CONFLICT, err.INVALID_OTP)
 
-    user = create_user(new_user)
+    user = await create_user(new_user)
     return UserProfileResponse(
         data=UserProfile(
             id=user.id,
@@ -78,16 +81,14 @@ async def register_user(new_user: UserCreateRequest) -> UserProfileResponse:
 async def reset_password(reset: UserResetPasswordRequest) -> ApiResponse:
     """Reset a new password"""
 
-    user: User = get_user(reset.msisdn)
+    user: User = await get_user(reset.msisdn)
     if not user:
         raise ApiException(status.HTTP_403_FORBIDDEN, err.INVALID_CREDENTIALS)
 
-    otp: Otp = get_otp(reset.msisdn)
-    # print(otp.confirmation, reset.otp_confirmation)
-    if not (otp and otp.confirmation and otp.confirmation == reset.otp_confirmation):
+    if not await get_otp_store().is_confirmed(reset.msisdn, reset.otp_confirmation):
         raise ApiException(status.HTTP_409_CONFLICT, err.INVALID_OTP)
 
-    update_user_password(user, reset.password)
+    await update_user_password(user, reset.password)
     return ApiResponse()
 
 
@@ -101,15 +102,18 @@ async def get_user_profile(
     user=Depends(JWTBearer(fetch_user=True)),
 ) -> UserProfileResponse:
     """Get user profile"""
+    usim_status, sim_status = await gather(
+        is_4g_compatible(user.msisdn), zend_sim(user.msisdn)
+    )
     return GetUserProfileResponse(
         data=GetUserProfile(
             id=user.id,
             msisdn=user.msisdn,
             name=user.name,
             email=user.email,
-            is_4g_compatible=is_4g_compatible(user.msisdn),
-            primary_offering_id=zend_sim(user.msisdn)["primary_offering_id"],
-            unified_sim_status=zend_sim(user.msisdn)["unified_sim_status"],
+            is_4g_compatible=usim_status,
+            primary_offering_id=sim_status["primary_offering_id"],
+            unified_sim_status=sim_status["unified_sim_status"],
             profile_pic_url=user.profile_pic_url,
         ),
     )
@@ -125,7 +129,7 @@ async def update_profile(
     user_profile: UserUpdateRequest, user=Depends(JWTBearer(fetch_user=True))
 ) -> UserProfileResponse:
     """Update user profile"""
-    updated_user = update_user(user, user_profile)
+    updated_user = await update_user(user, user_profile)
 
     return UserProfileResponse(
         data=UserProfile(
@@ -149,13 +153,13 @@ async def login(
     password: str = Body(..., regex=rgx.PASSWORD, max_length=40),
 ) -> TokensResponse:
     """Login and generate a refresh token"""
-    user = get_user(msisdn)
-    if user and verify_password(password, user.password):
+    user = await get_user(msisdn)
+    if user and await asyncio.to_thread(verify_password, password, user.password):
         access_token = sign_jwt({"msisdn": msisdn})
         refresh_token = sign_jwt(
             {"msisdn": msisdn, "grant_type": "refresh"}, settings.jwt_refresh_expires
         )
-        update_user_refresh_token(user, refresh_token)
+        await update_user_refresh_token(user, refresh_token)
         return TokensResponse(
             data=Tokens(
                 refresh_token=refresh_token,
@@ -177,7 +181,7 @@ async def validate_user_password(
     password: str = Body(..., regex=rgx.PASSWORD, max_length=40, embed=True),
 ) -> ApiResponse:
     """Validate user password for logged-in users"""
-    if user and verify_password(password, user.password):
+    if user and await asyncio.to_thread(verify_password, password, user.password):
         return ApiResponse()
     else:
         raise ApiException(status.HTTP_401_UNAUTHORIZED, err.INVALID_CREDENTIALS)
@@ -191,7 +195,7 @@ async def validate_user_password(
 )
 async def logout(user=Depends(JWTBearer(fetch_user=True))) -> ApiResponse:
     """Logout (aka delete refresh token)"""
-    delete_user_refresh_token(user)
+    await delete_user_refresh_token(user)
     return ApiResponse()
 
 
@@ -213,7 +217,7 @@ async def generate_access_token(
             )
         if bool(data) and "msisdn" in data:
             msisdn = data["msisdn"]
-            user = get_user(msisdn)
+            user = await get_user(msisdn)
             if user is not None:
                 access_token = sign_jwt({"msisdn": msisdn})
                 return TokensResponse(
@@ -237,5 +241,5 @@ async def generate_access_token(
 )
 async def delete(user=Depends(JWTBearer(fetch_user=True))) -> ApiResponse:
     """Delete user account"""
-    delete_user(user)
+    await delete_user(user)
     return ApiResponse()
@@ -0,0 +1,102 @@
+""" Benchmark: FastAPI's response_model serialization vs the fast (orjson) path
+
+    python bench_serialization.py [rounds]
+"""
+
+import asyncio
+import sys
+import time
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from api import serialization
+from api.number.models.response import RetrieveStatusResponse, SubscriptionsResponse
+from api.number.sim import Sim
+from api.number.subscriptions import Subscription
+from utils.settings import settings
+
+
+def sim_status() -> RetrieveStatusResponse:
+    return RetrieveStatusResponse(
+        data=Sim(
+            primary_offering_id=2122764,
+            cbs_status_code=1,
+            crm_status_code="B01",
+            crm_status_details="Normal",
+            activation_date="2022-01-30 16:00:25+03:00",
+            expiry_date="2022-05-19 00:00:00+03:00",
+            customer_type="Individual",
+            subscriber_type=0,
+            unified_sim_status="apNORMALp",
+            is_4g_compatible=True,
+            is_eligible=True,
+        )
+    )
+
+
+def subscriptions(count: int = 20) -> SubscriptionsResponse:
+    return SubscriptionsResponse(
+        data=[
+            Subscription(
+                id=200092 + index,
+                cycle_start=1650920400,
+                cycle_end=1653598800,
+                effective_time=1643549806,
+                expire_time=2114370000,
+                status=0,
+                app_handling="data",
+                offer={
+                    "name": f"Data bundle {index}",
+                    "price": 5000,
+                    "validity": 30,
+                    "quota": {"data": 10_240, "voice": 100},
+                },
+            )
+            for index in range(count)
+        ]
+    )
+
+
+async def fastapi_path(model, field) -> bytes:
+    """What a route does: validate against response_model, encode, json.dumps"""
+    content = await serialize_response(
+        field=field, response_content=model, exclude_none=True, is_coroutine=True
+    )
+    return JSONResponse(content).body
+
+
+async def fast_path(model) -> bytes:
+    return serialization.ModelResponse(model).body
+
+
+async def timed(serialize, rounds: int, repeat: int = 5) -> float:
+    """Best time per call, in microseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await serialize()
+        best = min(best, time.perf_counter() - start)
+    return 1e6 * best / rounds
+
+
+async def main(rounds: int) -> None:
+    for name, model in (
+        ("RetrieveStatusResponse", sim_status()),
+        ("SubscriptionsResponse", subscriptions()),
+    ):
+        field = create_response_field(name="response", type_=type(model))
+        settings.fast_json = False
+        baseline = await timed(lambda: fastapi_path(model, field), rounds)
+        stdlib = await timed(lambda: fast_path(model), rounds)
+        settings.fast_json = True
+        fast = await timed(lambda: fast_path(model), rounds)
+        print(
+            f"{name}: response_model {baseline:.1f}us, "
+            f"model bytes {stdlib:.1f}us, "
+            f"orjson {fast:.1f}us ({baseline / fast:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2_000))
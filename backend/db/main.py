@@ -1,9 +1,17 @@
+import asyncio
+import re
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from api.models.response import ApiException
 from utils.settings import settings
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
+# synchronous engine, for scripts (e.g. create_db.py) and table creation
 engine = create_engine(
     settings.database_url,
     pool_pre_ping=True,
@@ -15,5 +23,93 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base.metadata.create_all(bind=engine)
 
+_async_engine: AsyncEngine | None = None
+_async_engine_loop: asyncio.AbstractEventLoop | None = None
 
-__all__ = ["SessionLocal", "Base"]
+# session (& its lock) of the current request's unit of work
+_unit_of_work: ContextVar[tuple[AsyncSession, asyncio.Lock] | None] = ContextVar(
+    "unit_of_work", default=None
+)
+
+
+def async_database_url(url: str) -> str:
+    """The asyncpg flavour of a postgresql:// (psycopg2) database url"""
+    return re.sub(r"^postgres(ql)?(\+\w+)?://", "postgresql+asyncpg://", url)
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Engine used by the application (repositories).
+
+    Connections are bound to the event loop they were opened on, so a new
+    pool is created whenever the running loop changes (e.g. under TestClient).
+    """
+    global _async_engine, _async_engine_loop
+    loop = asyncio.get_running_loop()
+    if _async_engine is None or _async_engine_loop is not loop:
+        _async_engine = create_async_engine(
+            async_database_url(settings.database_url),
+            pool_pre_ping=True,
+            pool_size=20,
+            max_overflow=30,
+        )
+        _async_engine_loop = loop
+    return _async_engine
+
+
+def AsyncSessionLocal() -> AsyncSession:
+    """New session on the async engine, objects stay loaded after commit"""
+    return AsyncSession(get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[AsyncSession]:
+    """
+    One session and transaction shared by every repository call inside
+    (a connection is only checked out on first use). Committed on exit,
+    also on ApiException as those are deliberate responses that may follow
+    writes (e.g. counting a wrong otp), rolled back on any other error.
+    """
+    async with AsyncSessionLocal() as session:
+        token = _unit_of_work.set((session, asyncio.Lock()))
+        try:
+            yield session
+        except ApiException:
+            await session.commit()
+            raise
+        except BaseException:
+            await session.rollback()
+            raise
+        else:
+            await session.commit()
+        finally:
+            _unit_of_work.reset(token)
+
+
+@asynccontextmanager
+async def transaction() -> AsyncIterator[AsyncSession]:
+    """
+    Session of the current unit of work (committed when it ends), or outside
+    of one (scripts, tests, background work) a new session committed on exit.
+    Calls sharing a unit of work are serialized, as sessions are not
+    concurrency safe.
+    """
+    if (current := _unit_of_work.get()) is not None:
+        session, lock = current
+        async with lock:
+            yield session
+        return
+    async with AsyncSessionLocal() as session, session.begin():
+        yield session
+
+
+async def dispose_async_engine() -> None:
+    """Close pooled connections, called on application shutdown"""
+    global _async_engine, _async_engine_loop
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = None
+    _async_engine_loop = None
+
+
+__all__ = ["SessionLocal", "AsyncSessionLocal", "Base", "transaction", "unit_of_work"]
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import DateTime, Boolean, Column, Integer, String
+from sqlalchemy import DateTime, Boolean, Column, Integer, LargeBinary, String
 from db.main import Base
 
 
@@ -12,14 +12,31 @@ class Otp(Base):
     confirmation = Column(String, nullable=True)
     tries = Column(Integer, nullable=False, default=0)
     updated_at = Column(
-        DateTime(timezone=True), default=datetime.utcnow, nullable=False
-    )
-    created_at = Column(
         DateTime(timezone=True),
         default=datetime.utcnow,
         nullable=False,
         onupdate=datetime.utcnow,
     )
+    # issue time, the otp expires settings.otp_ttl after it
+    created_at = Column(
+        DateTime(timezone=True), default=datetime.utcnow, nullable=False
+    )
+
+
+class IdempotencyKey(Base):
+    """Response of a request made with an Idempotency-Key header"""
+
+    __tablename__ = "idempotency_keys"
+    key = Column(String, primary_key=True, index=True)
+    # sha256 of the request parameters, a reused key must carry the same ones
+    request_hash = Column(String, nullable=True)
+    # null while the first request is still being processed
+    status_code = Column(Integer, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(
+        DateTime(timezone=True), default=datetime.utcnow, nullable=False
+    )
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
 
 
 class User(Base):
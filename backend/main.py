@@ -1,5 +1,6 @@
 """ FastApi Main module """
 
+import random
 import time
 import traceback
 from typing import Any
@@ -8,21 +9,30 @@ from typing import Any
 
 # from settings import settings
 import json_logging
-from utils.settings import settings
+from utils.settings import LogPolicy, settings
 from api.user.router import router as user
 from api.otp.router import router as otp
+from api.otp import dispatch
+from api.otp.store import start_sweeper, stop_sweeper
 from api.number.router import router as number
+from api.number.client import close_client, deadline_scope
+from api.number import metrics as zend_metrics  # registers the zend collector
+from api.number import mock_transport
+from utils import metrics
+from api.number.memo import request_scope
+from db.main import dispose_async_engine
 from sqlalchemy.exc import SQLAlchemyError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from fastapi.exceptions import RequestValidationError
-from fastapi import FastAPI, Request, Depends, status
-from utils.logger import logger
-from fastapi.responses import JSONResponse
-from starlette.concurrency import iterate_in_threadpool
-import json
+from fastapi import FastAPI, Request, status
+from utils.logger import Lazy, decode_body, decode_headers, logger, redact
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from fastapi.encoders import jsonable_encoder
 from datetime import datetime
 from api.models.response import ApiResponse, ApiException
+from api.serialization import ModelResponse, ORJSONResponse
 from api.models.data import Error, Status
 from api.models import examples as api_examples
 
@@ -53,6 +63,7 @@ app = FastAPI(
     ],
     version="0.0.1",
     redoc_url=None,
+    default_response_class=ORJSONResponse if settings.fast_json else JSONResponse,
 )
 
 json_logging.init_request_instrument(app)
@@ -61,6 +72,9 @@ json_logging.init_request_instrument(app)
 @app.on_event("startup")
 async def app_startup():
     logger.info("Starting")
+    if settings.mock_zain_api:
+        mock_transport.load()
+    start_sweeper()
     openapi_schema = app.openapi()
     paths = openapi_schema["paths"]
     for path in paths:
@@ -81,18 +95,13 @@ async def app_startup():
 
 @app.on_event("shutdown")
 async def app_shutdown():
+    stop_sweeper()
+    await dispatch.drain()
+    await close_client()
+    await dispose_async_engine()
     logger.info("Application shutdown")
 
 
-async def capture_body(request: Request):
-    request.state.request_body = {}
-    if (
-        request.method == "POST"
-        and request.headers.get("content-type") == "application/json"
-    ):
-        request.state.request_body = await request.json()
-
-
 @app.exception_handler(StarletteHTTPException)
 async def my_exception_handler(_, exception):
     return JSONResponse(content=exception.detail, status_code=exception.status_code)
@@ -119,7 +128,7 @@ async def validation_exception_handler(_, exc: RequestValidationError):
     )
 
 
-@app.get("/", include_in_schema=False, dependencies=[Depends(capture_body)])
+@app.get("/", include_in_schema=False)
 async def root():
     """Micro-service card identifier"""
     return {
@@ -131,136 +140,192 @@ async def root():
     }
 
 
-@app.middleware("http")
-async def middle(request: Request, call_next):
-    """Wrapper function to manage errors and logging"""
-    if request.url._url.endswith("/docs") or request.url._url.endswith("/openapi.json"):
-        return await call_next(request)
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint (no api key, not logged)"""
+    return Response(metrics.render(), media_type=metrics.content_type)
+
+
+def _stack(ex: Exception) -> list[dict[str, Any]]:
+    return [
+        {
+            "file": frame.f_code.co_filename,
+            "function": frame.f_code.co_name,
+            "line": lineno,
+        }
+        for frame, lineno in traceback.walk_tb(ex.__traceback__)
+        if "site-packages" not in frame.f_code.co_filename
+    ]
+
+
+def _error_response(status_code: int, error: Error) -> ModelResponse:
+    return ModelResponse(ApiResponse(status=Status.failed, error=error), status_code)
+
+
+def _log_policy(scope: Scope) -> LogPolicy:
+    return settings.log_policies.get(metrics.route_name(scope), settings.log_policy)
+
+
+class LoggingMiddleware:
+    """
+    Api key, error handling and request logging as plain ASGI: response
+    messages are passed through as they are sent, request & response body
+    chunks are only teed and decoded when the log is written. What is kept
+    follows the route's LogPolicy, decided once the response starts (before
+    anything is copied).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or path.endswith(("/docs", "/openapi.json"))
+            or path == "/metrics"
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.time()
+        request = Request(scope)
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        response_headers: list[tuple[bytes, bytes]] = []
+        content_type = ""
+        body = bytearray()
+        truncated = False
+        # raw request body prefix, only decoded by the log writer
+        request_body = bytearray()
+        request_truncated = False
+        started = False
+        policy = settings.log_policy
+        keep = True
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_headers, content_type, truncated
+            nonlocal started, policy, keep
+            if message["type"] == "http.response.start":
+                started = True
+                status_code = message["status"]
+                policy = _log_policy(scope)
+                keep = status_code >= 400 or random.random() < policy.sample
+                headers = MutableHeaders(scope=message)
+                headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+                headers["Pragma"] = "no-cache"
+                headers["Expires"] = "0"
+                headers["X-Server-Time"] = datetime.now().isoformat()
+                response_headers = headers.raw
+                content_type = headers.get("content-type", "")
+            elif message["type"] == "http.response.body" and keep and not truncated:
+                chunk = message.get("body", b"")
+                room = policy.body_max_bytes - len(body)
+                truncated = len(chunk) > room
+                body.extend(chunk[:room])
+            await send(message)
+
+        async def receive_wrapper() -> Message:
+            nonlocal request_truncated
+            message = await receive()
+            if message["type"] == "http.request" and not request_truncated:
+                chunk = message.get("body", b"")
+                room = _log_policy(scope).body_max_bytes - len(request_body)
+                request_truncated = len(chunk) > room
+                request_body.extend(chunk[:room])
+            return message
 
-    start_time = time.time()
-    response_body: str = ""
-    # The api_key is enforced only if it set to none-empty value
-    if not settings.api_key or (
-        "key" in request.query_params
-        and settings.api_key == request.query_params["key"]
-    ):
         exception_data: dict[str, Any] | None = None
-        try:
-            response = await call_next(request)
-            raw_response = [section async for section in response.body_iterator]
-            response.body_iterator = iterate_in_threadpool(iter(raw_response))
-            response_body = json.loads(b"".join(raw_response))
-        except ApiException as ex:
-            response = JSONResponse(
-                status_code=ex.status_code,
-                content=jsonable_encoder(
-                    ApiResponse(status=Status.failed, error=ex.error)
-                ),
-            )
-            stack = [
-                {
-                    "file": frame.f_code.co_filename,
-                    "function": frame.f_code.co_name,
-                    "line": lineno,
-                }
-                for frame, lineno in traceback.walk_tb(ex.__traceback__)
-                if "site-packages" not in frame.f_code.co_filename
-            ]
-            exception_data = {"props": {"exception": str(ex), "stack": stack}}
-            response_body = json.loads(response.body.decode())
-
-        except Exception as ex:
-            # ex = sys.exc_info()[1]
-            if ex:
-                stack = [
-                    {
-                        "file": frame.f_code.co_filename,
-                        "function": frame.f_code.co_name,
-                        "line": lineno,
-                    }
-                    for frame, lineno in traceback.walk_tb(ex.__traceback__)
-                    if "site-packages" not in frame.f_code.co_filename
-                ]
-                exception_data = {"props": {"exception": str(ex), "stack": stack}}
-            response = JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content=jsonable_encoder(
-                    ApiResponse(
-                        status=Status.failed,
-                        error=Error(type="internal", code=99, message=str(ex)),
+        # The api_key is enforced only if it set to none-empty value
+        if not settings.api_key or (
+            "key" in request.query_params
+            and settings.api_key == request.query_params["key"]
+        ):
+            try:
+                with request_scope(), deadline_scope(settings.zend_deadline):
+                    await self.app(scope, receive_wrapper, send_wrapper)
+            except Exception as ex:
+                if started:
+                    # too late for an error response, the client sees a cut body
+                    logger.exception("Response failed after it started")
+                    raise
+                exception_data = {"props": {"exception": str(ex), "stack": _stack(ex)}}
+                if isinstance(ex, ApiException):
+                    response = _error_response(ex.status_code, ex.error)
+                else:
+                    response = _error_response(
+                        status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        Error(type="internal", code=99, message=str(ex)),
                     )
-                ),
+                await response(scope, receive, send_wrapper)
+        else:
+            response = _error_response(
+                status.HTTP_400_BAD_REQUEST,
+                Error(type="bad request", code=100, message="Invalid request."),
             )
-            response_body = json.loads(response.body.decode())
-    else:
-        response = JSONResponse(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            content=jsonable_encoder(
-                ApiResponse(
-                    status=Status.failed,
-                    error=Error(
-                        type="bad request", code=100, message="Invalid request."
+            await response(scope, receive, send_wrapper)
+
+        duration = time.time() - start_time
+        metrics.route_latency.labels(
+            request.method, metrics.route_name(scope), status_code
+        ).observe(duration)
+        if not keep:
+            return
+
+        extra = {
+            "props": {
+                "duration": 1000 * duration,
+                "request": {
+                    "verb": request.method,
+                    "path": path,
+                    "headers": Lazy(decode_headers, scope["headers"], policy.headers),
+                    "query_params": Lazy(
+                        redact, dict(request.query_params.items()), policy.redact
+                    ),
+                    "body": Lazy(
+                        decode_body,
+                        bytes(request_body),
+                        request_truncated,
+                        request.headers.get("content-type", ""),
+                        policy.redact,
                     ),
-                )
-            ),
-        )
-        response_body = json.loads(response.body.decode())
-
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
-    response.headers["X-Server-Time"] = datetime.now().isoformat()
-
-    extra = {
-        "props": {
-            "duration": 1000 * (time.time() - start_time),
-            "request": {
-                "verb": request.method,
-                "path": str(request.url.path),
-                "headers": dict(request.headers.items()),
-                "query_params": dict(request.query_params.items()),
-                "body": request.state.request_body
-                if hasattr(request.state, "request_body")
-                else {},
-            },
-            "response": {
-                "headers": dict(response.headers.items()),
-                "body": response_body,
-            },
-            "http_status": response.status_code,
+                },
+                "response": {
+                    "headers": Lazy(decode_headers, response_headers, policy.headers),
+                    "body": Lazy(
+                        decode_body,
+                        bytes(body),
+                        truncated,
+                        content_type,
+                        policy.redact_response,
+                    ),
+                },
+                "http_status": status_code,
+            }
         }
-    }
+        if exception_data:
+            extra["props"]["exception"] = exception_data
 
-    if exception_data:
-        extra["props"]["exception"] = exception_data
-    if hasattr(request.state, "request_body"):
-        extra["props"]["request"]["body"] = request.state.request_body
-    if response_body:
-        extra["props"]["response"]["body"] = response_body
+        logger.info("Processed", extra=extra)
 
-    logger.info("Processed", extra=extra)
 
-    return response
+app.add_middleware(LoggingMiddleware)
 
 
 app.include_router(
     user,
     prefix="/api/user",
-    dependencies=[Depends(capture_body)],
     tags=["user"],
     responses=api_examples.general_response([api_examples.validation]),
 )
 app.include_router(
     otp,
     prefix="/api/otp",
-    dependencies=[Depends(capture_body)],
     tags=["otp"],
     responses=api_examples.general_response([api_examples.validation]),
 )
 app.include_router(
     number,
     prefix="/api/number",
-    dependencies=[Depends(capture_body)],
     tags=["number"],
     responses=api_examples.general_response(
         [api_examples.validation, api_examples.not_authenticated]
@@ -268,11 +333,11 @@ app.include_router(
 )
 
 
-@app.get("/{x:path}", include_in_schema=False, dependencies=[Depends(capture_body)])
-@app.post("/{x:path}", include_in_schema=False, dependencies=[Depends(capture_body)])
-@app.put("/{x:path}", include_in_schema=False, dependencies=[Depends(capture_body)])
-@app.patch("/{x:path}", include_in_schema=False, dependencies=[Depends(capture_body)])
-@app.delete("/{x:path}", include_in_schema=False, dependencies=[Depends(capture_body)])
+@app.get("/{x:path}", include_in_schema=False)
+@app.post("/{x:path}", include_in_schema=False)
+@app.put("/{x:path}", include_in_schema=False)
+@app.patch("/{x:path}", include_in_schema=False)
+@app.delete("/{x:path}", include_in_schema=False)
 async def catchall():
     raise ApiException(
         status_code=status.HTTP_404_NOT_FOUND,
@@ -0,0 +1,28 @@
+import asyncio
+from utils.dispatch import WorkQueue
+
+
+def test_work_queue():
+    handled: list[list[str]] = []
+    failures = {"flaky": 1, "broken": 10}
+
+    async def handler(items: list[str]) -> list[str]:
+        handled.append(items)
+        failed = [item for item in items if failures.get(item, 0) > 0]
+        for item in failed:
+            failures[item] -= 1
+        return failed
+
+    async def run():
+        queue = WorkQueue("test", handler, maxsize=3, batch_size=2, max_attempts=2)
+        queue.retry_delay = 0.01
+        assert queue.submit("ok")
+        assert queue.submit("flaky")
+        assert queue.submit("broken")
+        assert not queue.submit("dropped")  # full
+        await queue.drain(1)  # waits for the retries too
+
+    asyncio.run(run())
+    # batched, flaky retried once and broken given up after two attempts
+    assert handled[0] == ["ok", "flaky"]
+    assert sorted(sum(handled, [])) == ["broken", "broken", "flaky", "flaky", "ok"]
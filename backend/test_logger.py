@@ -0,0 +1,30 @@
+import gzip
+import logging
+import time
+from utils.logger import QueuedFileHandler
+
+
+def test_queued_file_handler(tmp_path):
+    filename = tmp_path / "test.log"
+    handler = QueuedFileHandler(str(filename), 500, 5, queue_size=100, batch_size=4)
+    handler.compress_delay = 0
+    for i in range(40):
+        handler.handle(logging.makeLogRecord({"msg": f"record {i:03} " * 3}))
+    handler.close()
+    assert handler.written == 40 and handler.dropped == 0
+
+    # rotated past max_bytes and gzipped, no record lost
+    deadline = time.monotonic() + 2
+    while list(tmp_path.glob("test.log.*[0-9]")) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not list(tmp_path.glob("test.log.*[0-9]"))
+    archives = sorted(tmp_path.glob("test.log.*.gz"))
+    assert archives
+    lines = b"".join(gzip.open(archive).read() for archive in archives)
+    lines += filename.read_bytes()
+    assert len(lines.splitlines()) == 40
+
+    # the writer is stopped: the queue fills up and the rest is dropped
+    for i in range(105):
+        handler.handle(logging.makeLogRecord({"msg": "overflow"}))
+    assert handler.overflows == handler.dropped == 5
@@ -1,15 +1,27 @@
+import asyncio
+import json
+import logging
 import time
+from fastapi.encoders import jsonable_encoder
 from fastapi.testclient import TestClient
 from fastapi import status
 from test_utils import check_invalid_msisdn, check_validation, check_valid_access_token
 from utils.password_hashing import verify_password
 from main import app
+from utils import metrics
+from utils.logger import _resolve, logger
+from utils.settings import settings
 from db.models import User
 from utils.jwt import sign_jwt
-from api.otp.repository import delete_otp, create_otp, get_otp
+from api.otp.store import get_otp_store
+from api.number.models.response import SubscriptionsResponse
+from api.number.repository import release_idempotency_key, reserve_idempotency_key
+from api.number.subscriptions import Subscription
+from api.serialization import model_bytes
 from api.user.repository import delete_user, get_user
 
 client = TestClient(app)
+otp_store = get_otp_store()
 
 
 msisdn: str = "7841631859"
@@ -21,17 +33,17 @@ user: User = User()
 
 
 # cleaning otp
-delete_otp(msisdn)
-delete_otp("7555555555")
+asyncio.run(otp_store.delete(msisdn))
+asyncio.run(otp_store.delete("7555555555"))
 
 # cleaning users
-if user := get_user(msisdn):
-    delete_user(user)
-if user := get_user("7555555555"):
-    delete_user(user)
+if user := asyncio.run(get_user(msisdn)):
+    asyncio.run(delete_user(user))
+if user := asyncio.run(get_user("7555555555")):
+    asyncio.run(delete_user(user))
 
 # generate confirmation to create user
-otp = create_otp(msisdn, "123456", confirmation)
+asyncio.run(otp_store.create(msisdn, "123456", confirmation))
 
 
 code: str = "123456"
@@ -52,7 +64,7 @@ def test_request_otp():
     assert response.status_code == status.HTTP_200_OK
     assert {"status": "success"} == response.json()
 
-    otp = get_otp(msisdn)
+    otp = asyncio.run(otp_store.get(msisdn))
     assert otp
     code = otp.code
 
@@ -80,7 +92,7 @@ def test_confirm_otp():
     response = client.post(endpoint, json={"msisdn": msisdn, "code": code})
     # print(response.json())
     assert response.status_code == status.HTTP_200_OK
-    assert get_otp(msisdn).confirmation
+    assert asyncio.run(otp_store.get(msisdn)).confirmation
     confirmation = response.json()["data"]["confirmation"]
 
 
@@ -114,8 +126,8 @@ def test_verify_otp():
 
 def test_create_user():
     # delete user if exists
-    if existing_user := get_user(msisdn):
-        delete_user(existing_user)
+    if existing_user := asyncio.run(get_user(msisdn)):
+        asyncio.run(delete_user(existing_user))
 
     endpoint = "/api/user/create"
     request_data = {
@@ -149,7 +161,7 @@ def test_create_user():
     assert response.status_code == 200
 
     global user
-    user = get_user(msisdn)
+    user = asyncio.run(get_user(msisdn))
     assert user
     assert response.json()["data"] == {
         "id": user.id,
@@ -184,7 +196,8 @@ def test_login_user():
     response = client.post(endpoint, json={"msisdn": msisdn, "password": password})
     # print(response.json())
     assert response.status_code == status.HTTP_200_OK
-    assert get_user(msisdn).refresh_token  # assert persisted in the database
+    # assert persisted in the database
+    assert asyncio.run(get_user(msisdn)).refresh_token
     data = response.json()
 
     global access_token
@@ -229,7 +242,7 @@ def test_update_profile():
     }
     response = client.patch(endpoint, headers=headers, json={"name": "someone else"})
     assert response.status_code == status.HTTP_200_OK
-    assert get_user(msisdn).name == "someone else"
+    assert asyncio.run(get_user(msisdn)).name == "someone else"
 
     msisdn_new = "7555555555"
     # request opt
@@ -360,7 +373,7 @@ def test_reset_password():
     assert response.status_code == status.HTTP_200_OK
     assert {"status": "success"} == response.json()
 
-    user = get_user(msisdn)
+    user = asyncio.run(get_user(msisdn))
     assert verify_password(new_password, user.password)
 
     # test user not found
@@ -458,6 +471,34 @@ def test_sim_status():
     check_validation(response)
 
 
+def test_sim_status_batch():
+    endpoint = "/api/number/status/batch"
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response = client.post(
+        endpoint, headers=headers, json={"msisdns": [msisdn, msisdn, "7555555555"]}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["msisdn"] for line in lines) == ["7555555555", msisdn]
+    assert all(line["status"] == "success" for line in lines)
+
+    # Invalid msisdn format
+    response = client.post(endpoint, headers=headers, json={"msisdns": ["784163185b"]})
+    check_validation(response)
+
+    # Too many msisdns
+    msisdns = [f"78{i:08}" for i in range(settings.zend_batch_max_size + 1)]
+    response = client.post(endpoint, headers=headers, json={"msisdns": msisdns})
+    check_validation(response)
+
+    # wrong access token
+    headers = {"Authorization": f"Bearer {refresh_token}"}
+    response = client.post(endpoint, headers=headers, json={"msisdns": [msisdn]})
+    check_valid_access_token(response)
+
+
 def test_charge_voucher():
     endpoint = "/api/number/charge-voucher"
     headers = {
@@ -497,6 +538,43 @@ def test_charge_voucher():
     check_valid_access_token(response)
 
 
+def test_idempotent_subscribe():
+    endpoint = "/api/number/subscribe"
+    headers = {
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+        "Idempotency-Key": f"test-{time.time()}",
+    }
+    request_data = {"msisdn": msisdn, "offer_id": 1000}
+
+    response = client.post(endpoint, headers=headers, json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert "idempotent-replayed" not in response.headers
+
+    replay = client.post(endpoint, headers=headers, json=request_data)
+    assert replay.status_code == status.HTTP_200_OK
+    assert replay.headers["idempotent-replayed"] == "true"
+    assert replay.content == response.content
+
+    # same key, different request
+    reused = client.post(
+        endpoint, headers=headers, json={**request_data, "offer_id": 1}
+    )
+    assert reused.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert reused.json()["error"]["code"] == 422
+
+
+def test_idempotency_lease():
+    key = f"{msisdn}:test:{time.time()}"
+    assert asyncio.run(reserve_idempotency_key(key, "hash", 60, lease=60))
+    # held by an unfinished first request
+    assert not asyncio.run(reserve_idempotency_key(key, "hash", 60, lease=60))
+    # past its lease (e.g. the worker was killed) the key is taken over
+    time.sleep(0.01)
+    assert asyncio.run(reserve_idempotency_key(key, "hash", 60, lease=0))
+    asyncio.run(release_idempotency_key(key))
+
+
 def test_nba():
     endpoint = "/api/number/welcome-message?msisdn"
     headers = {
@@ -521,6 +599,39 @@ def test_nba():
     check_valid_access_token(response)
 
 
+def test_home():
+    endpoint = "/api/number/home?msisdn"
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    response = client.get(f"{endpoint}={msisdn}", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()["data"]
+    # every section loaded, none failed
+    assert set(data) == {
+        "status",
+        "wallet",
+        "subscriptions",
+        "subaccounts",
+        "welcome_message",
+    }
+    assert data["status"]["unified_sim_status"]
+    assert {"balance", "loan"} <= set(data["wallet"])
+    assert isinstance(data["subscriptions"], list)
+    assert isinstance(data["subaccounts"], list)
+    assert data["welcome_message"]["nba"]
+
+    response = client.get(
+        f"{endpoint}={msisdn}&sections=wallet&sections=welcome_message",
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert set(response.json()["data"]) == {"wallet", "welcome_message"}
+
+    # Invalid msisdn
+    response = client.get(f"{endpoint}=7841631850", headers=headers)
+    check_invalid_msisdn(response)
+
+
 def test_redeem_registration_gift():
     endpoint = "/api/number/redeem-registration-gift"
     headers = {
@@ -547,6 +658,95 @@ def test_redeem_registration_gift():
     check_valid_access_token(response)
 
 
+def test_metrics():
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert "zend_request_duration_seconds_bucket" in response.text
+    assert 'endpoint="esb/subscriber-information"' in response.text
+    assert "http_request_duration_seconds_count" in response.text
+
+
+def test_metrics_multiprocess(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    text = metrics.render()
+    # in-process collectors are exposed next to the multiprocess values
+    assert b"zend_cache_size" in text
+    assert b"log_queue_depth" in text
+
+
+def test_model_bytes():
+    model = SubscriptionsResponse(data=[Subscription(id=991, offer={"quota": 1})])
+    expected = jsonable_encoder(model)
+    fast_json = settings.fast_json
+    try:
+        settings.fast_json = False
+        assert json.loads(model_bytes(model)) == expected
+        settings.fast_json = True
+        assert json.loads(model_bytes(model)) == expected
+    finally:
+        settings.fast_json = fast_json
+
+
+def test_log_redaction():
+    logged = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            logged.append(_resolve(record.props))
+
+    capture = Capture()
+    logger.addHandler(capture)
+    try:
+        login = client.post(
+            "/api/user/login", json={"msisdn": msisdn, "password": "00000000"}
+        )
+        voucher = client.post(
+            "/api/number/charge-voucher",
+            headers={"Authorization": f"Bearer {refresh_token}"},
+            json={"msisdn": msisdn, "pincode": "1111111111111111"},
+        )
+    finally:
+        logger.removeHandler(capture)
+
+    for response, log in zip((login, voucher), logged):
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        # the error is logged as it was sent, only the request secrets are masked
+        assert log["response"]["body"] == response.json()
+        assert log["request"]["body"]["msisdn"] == msisdn
+    assert logged[0]["request"]["body"]["password"] == "***"
+    assert logged[1]["request"]["body"]["pincode"] == "***"
+
+
+def test_log_redaction_login():
+    global access_token
+    global refresh_token
+    logged = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            if hasattr(record, "props"):
+                logged.append(json.dumps(_resolve(record.props)))
+
+    capture = Capture()
+    logger.addHandler(capture)
+    try:
+        response = client.post(
+            "/api/user/login", json={"msisdn": msisdn, "password": password}
+        )
+    finally:
+        logger.removeHandler(capture)
+    assert response.status_code == status.HTTP_200_OK
+    access_token = response.json()["data"]["access_token"]
+    refresh_token = response.json()["data"]["refresh_token"]
+
+    [line] = logged
+    assert access_token not in line and refresh_token not in line
+    assert password not in line
+    log = json.loads(line)
+    assert log["response"]["body"]["data"]["access_token"] == "***"
+    assert log["response"]["body"]["data"]["refresh_token"] == "***"
+
+
 def test_logout():
     endpoint = "/api/user/logout"
     headers = {"Authorization": f"Bearer {access_token}"}
@@ -555,7 +755,7 @@ def test_logout():
     assert response.status_code == status.HTTP_200_OK
     assert {"status": "success"} == response.json()
 
-    assert get_user(msisdn).refresh_token is None
+    assert asyncio.run(get_user(msisdn)).refresh_token is None
 
     # wrong access token
     headers = {"Authorization": f"Bearer {refresh_token}"}
@@ -576,7 +776,7 @@ def test_delete():
     response = client.delete(endpoint, headers=headers)
     assert response.status_code == status.HTTP_200_OK
     assert {"status": "success"} == response.json()
-    assert not get_user(msisdn)
+    assert not asyncio.run(get_user(msisdn))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,30 @@
+import asyncio
+from api.otp import store as otp_store
+from utils.settings import settings
+
+msisdn = "7839921514"
+
+
+def test_memory_otp_store(tmp_path, monkeypatch):
+    store = otp_store.MemoryOtpStore(str(tmp_path / "otp.sqlite3"))
+    monkeypatch.setattr(settings, "otp_ttl", 0.05)
+    monkeypatch.setattr(settings, "otp_sweep_interval", 0.01)
+    monkeypatch.setattr(otp_store, "_otp_store", store)
+
+    async def run():
+        await store.create(msisdn, "165132")
+        assert (await store.get(msisdn)).code == "165132"
+        confirmation = await store.confirm(msisdn, "165132")
+        assert await store.is_confirmed(msisdn, confirmation)
+        await asyncio.sleep(0.06)
+        assert await store.get(msisdn) is None
+        assert await store.confirm(msisdn, "165132") is None
+        assert not await store.is_confirmed(msisdn, confirmation)
+
+        # expired rows are dropped by the sweeper
+        otp_store.start_sweeper()
+        await asyncio.sleep(0.05)
+        otp_store.stop_sweeper()
+        assert store._db.execute("SELECT count(*) FROM otp").fetchone() == (0,)
+
+    asyncio.run(run())
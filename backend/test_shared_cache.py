@@ -0,0 +1,87 @@
+import asyncio
+import httpx
+import pytest
+from api.number import client, shared_cache
+from api.number.shared_cache import RedisCache, SQLiteCache
+from api.number.zend import (
+    zend_balance_api,
+    zend_check_4g_api,
+    zend_free_units_api,
+    zend_query_bill,
+    zend_sim_api,
+    zend_subscriptions_api,
+)
+from utils.settings import settings
+
+msisdn = "7839921514"
+
+# the endpoints read through the shared cache
+endpoints = [
+    zend_balance_api,
+    zend_check_4g_api,
+    zend_free_units_api,
+    zend_query_bill,
+    zend_sim_api,
+    zend_subscriptions_api,
+]
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def new_cache(request, tmp_path):
+    """Builds the backend, inside the event loop of the test"""
+    if request.param == "sqlite":
+        return lambda: SQLiteCache(str(tmp_path / "zend-cache.sqlite3"))
+    redis = pytest.importorskip("redis")
+    try:
+        redis.Redis.from_url(settings.zend_shared_cache_url).ping()
+    except redis.exceptions.ConnectionError:
+        pytest.skip("no redis server")
+    return lambda: RedisCache(settings.zend_shared_cache_url)
+
+
+def test_get_set_expiry(new_cache):
+    async def run():
+        cache = new_cache()
+        await cache.set("test:a", b"1", 0.1)
+        await cache.set("test:b", b"2", 10)
+        assert await cache.get("test:a") == b"1"
+        assert await cache.get("test:b") == b"2"
+        assert await cache.get("test:missing") is None
+
+        await cache.delete("test:b", "test:missing")
+        assert await cache.get("test:b") is None
+        await asyncio.sleep(0.15)
+        assert await cache.get("test:a") is None
+
+    asyncio.run(run())
+
+
+def test_evict(monkeypatch, tmp_path):
+    sent: list[str] = []
+
+    async def send(method: str, endpoint: str, url: str, **kwargs) -> httpx.Response:
+        sent.append(url)
+        return httpx.Response(200, content=b"{}", request=httpx.Request(method, url))
+
+    async def get_all():
+        for endpoint in endpoints:
+            await client.get(endpoint, msisdn)
+
+    async def run():
+        await get_all()
+        assert len(sent) == len(endpoints)
+        await get_all()  # answered by the shared cache
+        assert len(sent) == len(endpoints)
+
+        await shared_cache.evict(msisdn)
+        cache = shared_cache.get_shared_cache()
+        for endpoint in endpoints:
+            assert await cache.get(shared_cache.cache_key(endpoint, msisdn)) is None
+        await get_all()
+        assert len(sent) == 2 * len(endpoints)
+
+    assert all(shared_cache.ttl_for(endpoint) for endpoint in endpoints)
+    cache = SQLiteCache(str(tmp_path / "zend-cache.sqlite3"))
+    monkeypatch.setattr(shared_cache, "_shared_cache", cache)
+    monkeypatch.setattr(client, "_send", send)
+    asyncio.run(run())
@@ -0,0 +1,324 @@
+import asyncio
+import time
+import httpx
+import pytest
+from api.models.response import ApiException
+from api.number import cache as zend_cache
+from api.number import hedge, retry, zend
+from api.number.breaker import CircuitBreaker, Guard, ZendUnavailable
+from api.number.cache import MISSING, TTLCache
+from api.number.retry import RetryBudget
+from api.number.memo import request_scope, single_flight
+from utils.settings import settings
+
+calls: list[str] = []
+
+
+@single_flight
+async def lookup(msisdn: str) -> dict:
+    calls.append(msisdn)
+    await asyncio.sleep(0.01)
+    return {"msisdn": msisdn}
+
+
+def test_single_flight():
+    async def run():
+        with request_scope():
+            first, second, other = await asyncio.gather(
+                lookup("7839921514"), lookup("7839921514"), lookup("7841631859")
+            )
+            assert first is second
+            assert other["msisdn"] == "7841631859"
+            await lookup("7839921514")
+        assert calls == ["7839921514", "7841631859"]
+
+        # outside of a request every call goes upstream
+        await lookup("7839921514")
+        assert len(calls) == 3
+
+    calls.clear()
+    asyncio.run(run())
+
+
+def test_ttl_cache():
+    cache = TTLCache(maxsize=2, ttl=0.05, stale_ttl=0.1)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") is MISSING
+    cache.delete("c")
+    assert cache.get("c") is MISSING
+    time.sleep(0.06)
+    assert cache.get("a") is MISSING
+    assert cache.get_stale("a") == 1
+    time.sleep(0.05)
+    assert cache.get_stale("a") is MISSING
+    assert cache.stats() == {
+        "size": 0,
+        "hits": 1,
+        "misses": 3,
+        "stale_hits": 1,
+        "evictions": 1,
+        "expirations": 1,
+        "invalidations": 1,
+    }
+
+
+def test_stale_while_revalidate(monkeypatch):
+    answers = iter([True, False])
+    statuses = iter(["NORMAL", "BLOCK_STOLEN"])
+
+    @zend_cache.stale_while_revalidate
+    async def usim(msisdn: str) -> bool:
+        return next(answers)
+
+    @zend_cache.cached
+    async def sim(msisdn: str) -> str:
+        return next(statuses)
+
+    async def run():
+        assert await usim("7839921514") is True
+        assert await sim("7839921514") == "NORMAL"
+        time.sleep(0.06)
+        # stale value served at once, refreshed in the background
+        assert await usim("7839921514") is True
+        await asyncio.sleep(0)
+        assert await usim("7839921514") is False
+        # a plain cached lookup is fetched fresh past its ttl
+        assert await sim("7839921514") == "BLOCK_STOLEN"
+
+    cache = TTLCache(maxsize=10, ttl=0.05, stale_ttl=10)
+    monkeypatch.setattr(zend_cache, "subscriber_cache", cache)
+    asyncio.run(run())
+
+
+def test_ineligible_cache(monkeypatch):
+    lookups: list[str] = []
+
+    async def zend_sim(msisdn: str) -> dict:
+        lookups.append(msisdn)
+        return {"is_eligible": False, "unified_sim_status": "BLOCK_STOLEN"}
+
+    @zend_cache.invalidates
+    async def recharge(msisdn: str) -> bool:
+        return True
+
+    async def run():
+        assert await zend.zend_is_eligible("7839921514") is False
+        assert await zend.zend_is_eligible("7839921514") is False
+        assert lookups == ["7839921514"]  # the repeat skipped the backend
+        time.sleep(0.06)
+        assert await zend.zend_is_eligible("7839921514") is False
+        assert len(lookups) == 2  # expired
+        await recharge("7839921514")
+        assert await zend.zend_is_eligible("7839921514") is False
+        assert len(lookups) == 3  # invalidated by the write
+
+    cache = TTLCache(10, ttl=0.05)
+    monkeypatch.setattr(zend, "zend_sim", zend_sim)
+    monkeypatch.setattr(zend, "ineligible_cache", cache)
+    monkeypatch.setattr(zend_cache, "ineligible_cache", cache)
+    asyncio.run(run())
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker("esb/query-balance", 2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()  # single probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.transitions == {"open": 1, "half_open": 1, "closed": 1}
+
+
+def test_guard(monkeypatch):
+    monkeypatch.setattr(settings, "zend_bulkhead_limit", 2)
+    monkeypatch.setattr(settings, "zend_breaker_failure_threshold", 5)
+    guard = Guard("esb/query-balance")
+
+    async def run():
+        answered = asyncio.Event()
+
+        async def send():
+            await answered.wait()
+            return Reply(200)
+
+        calls = [asyncio.ensure_future(guard.call(send)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert guard.in_flight == 2
+        # over the limit: rejected without calling upstream
+        with pytest.raises(ZendUnavailable):
+            await guard.call(send)
+        assert guard.rejected == 1
+
+        # a cancelled call frees its slot, and isn't a failure
+        calls[0].cancel()
+        await asyncio.sleep(0)
+        assert guard.in_flight == 1
+        answered.set()
+        assert (await calls[1]).status_code == 200
+        assert (await guard.call(send)).status_code == 200
+        assert guard.stats() == {
+            "state": "closed",
+            "failures": 0,
+            "transitions": {},
+            "in_flight": 0,
+            "rejected": 1,
+        }
+
+    asyncio.run(run())
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, cap=1)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+class Reply:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    """Hedging on, with a p95 of 0.05s for the "test" endpoint"""
+    monkeypatch.setattr(settings, "zend_hedge", True)
+    monkeypatch.setattr(settings, "zend_hedge_min_samples", 100)
+    monkeypatch.setattr(hedge, "budget", RetryBudget(1, 0, 10))
+    monkeypatch.setitem(hedge.windows, "test", hedge.LatencyWindow(100))
+    for i in range(100):
+        hedge.record("test", 0.05 if i < 96 else 1)
+
+
+def hedged_calls(*attempts: tuple[float, object]) -> tuple[list, list, list]:
+    """
+    Runs hedge.hedged over attempts of (seconds, status or exception),
+    returns the result, start offsets and cancelled attempts.
+    """
+    started: list[float] = []
+    cancelled: list[int] = []
+
+    async def send():
+        attempt = len(started)
+        started.append(time.monotonic())
+        seconds, outcome = attempts[attempt]
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            cancelled.append(attempt)
+            raise
+        if isinstance(outcome, Exception):
+            raise outcome
+        return Reply(outcome)
+
+    async def run():
+        try:
+            return [await hedge.hedged("test", send)]
+        except Exception as e:
+            return [e]
+
+    result = asyncio.run(run())
+    return result, [s - started[0] for s in started], cancelled
+
+
+def test_hedge(hedging):
+    # fast enough, no hedge
+    [result], offsets, _ = hedged_calls((0.01, 200))
+    assert result.status_code == 200 and offsets == [0]
+
+    # slow first attempt: hedged at the p95, the loser is cancelled
+    [result], offsets, cancelled = hedged_calls((1, 200), (0.01, 201))
+    assert result.status_code == 201
+    assert 0.05 <= offsets[1] < 0.5
+    assert cancelled == [0]
+
+    # a fast 5xx doesn't win over a slower success
+    [result], _, cancelled = hedged_calls((0.2, 200), (0.01, 503))
+    assert result.status_code == 200 and cancelled == []
+
+    # both fail: the answer is preferred over the error
+    [result], _, _ = hedged_calls((0.1, 503), (0.01, ConnectionError()))
+    assert result.status_code == 503
+    [result], _, _ = hedged_calls((0.1, OSError()), (0.01, ConnectionError()))
+    assert isinstance(result, OSError)
+
+
+def retried(*outcomes: object, left: float | None = None) -> tuple[object, int]:
+    """with_retries over outcomes (status, exception or seconds to hang)"""
+    sent = []
+
+    async def send():
+        outcome = outcomes[min(len(sent), len(outcomes) - 1)]
+        sent.append(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        if isinstance(outcome, float):
+            await asyncio.sleep(outcome)
+            return Reply(200)
+        return Reply(outcome)
+
+    deadline = None if left is None else time.monotonic() + left
+
+    def remaining() -> float | None:
+        return None if deadline is None else deadline - time.monotonic()
+
+    async def run():
+        try:
+            return (await retry.with_retries("test", send, remaining)).status_code
+        except Exception as ex:
+            return ex
+
+    return asyncio.run(run()), len(sent)
+
+
+@pytest.fixture
+def retries(monkeypatch):
+    monkeypatch.setattr(settings, "zend_retry_attempts", 2)
+    monkeypatch.setattr(retry, "backoff", lambda attempt: 0.01)
+    monkeypatch.setattr(retry, "budget", RetryBudget(ratio=1, min_per_second=0, cap=10))
+
+
+@pytest.mark.parametrize("status_code", [502, 503, 504])
+def test_retry_statuses(retries, status_code):
+    assert retried(status_code, 200) == (200, 2)
+
+
+def test_retry_transport_error(retries):
+    assert retried(httpx.TransportError("reset"), 200) == (200, 2)
+    # other answers are final
+    assert retried(500, 200) == (500, 1)
+
+
+def test_retry_attempts(retries):
+    # the attempt cap: the last answer, or error, is returned
+    assert retried(503) == (503, 3)
+    error, sent = retried(httpx.TransportError("reset"))
+    assert isinstance(error, httpx.TransportError) and sent == 3
+
+
+def test_retry_deadline(retries):
+    # no retry when the backoff would outlive the deadline
+    assert retried(503, 200, left=0.005) == (503, 1)
+    # nor any attempt past it
+    start = time.monotonic()
+    error, sent = retried(1.0, left=0.05)
+    assert isinstance(error, ApiException) and sent == 1
+    assert time.monotonic() - start < 0.5
+
+
+def test_retry_budget_exhausted(retries, monkeypatch):
+    monkeypatch.setattr(retry, "budget", RetryBudget(ratio=0, min_per_second=0, cap=1))
+    assert retried(503, 503, 200) == (503, 2)
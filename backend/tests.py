@@ -1,3 +1,4 @@
+import asyncio
 import json
 
 HEADER = "\033[95m"
@@ -13,7 +14,7 @@ UNDERLINE = "\033[4m"
 from api.number.tests import test as number
 
 # bss_response = bss()
-print(json.dumps(number(), indent=2, sort_keys=True, default=str))
+print(json.dumps(asyncio.run(number()), indent=2, sort_keys=True, default=str))
 # report = [ {"bss": bss_response}, ]
 # for one in report:
 #    name = next(iter(one))
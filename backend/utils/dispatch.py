@@ -0,0 +1,130 @@
+""" In-process background work queues (run after the response is sent) """
+
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable
+from utils import metrics
+from utils.logger import logger
+
+# handles a batch of items, returns the ones that failed
+BatchHandler = Callable[[list[Any]], Awaitable[list[Any]]]
+
+
+class WorkQueue:
+    """
+    Bounded queue consumed by one worker task per event loop. Items are
+    handled in batches of up to batch_size; failed items are retried with
+    backoff up to max_attempts, then dropped. Submitting to a full queue
+    drops the item instead of blocking the request.
+    """
+
+    retry_delay = 0.5
+
+    def __init__(
+        self,
+        name: str,
+        handler: BatchHandler,
+        maxsize: int,
+        batch_size: int,
+        max_attempts: int,
+    ):
+        self.name = name
+        self.handler = handler
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._queue: asyncio.Queue[tuple[int, Any]] | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # backoff sleeps of failed items, referenced until they re-enqueue
+        self._retries: set[asyncio.Task] = set()
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # queues are bound to their loop (e.g. a new one per TestClient call)
+            self._queue = asyncio.Queue(self.maxsize)
+            self._worker = None
+            self._retries = set()
+            self._loop = loop
+        if self._worker is None or self._worker.done():
+            # fresh context: not bound by the submitting request's deadline
+            self._worker = contextvars.Context().run(loop.create_task, self._run())
+        return self._queue
+
+    def _put(self, item: Any, attempt: int = 1) -> bool:
+        queue = self._ensure_worker()
+        try:
+            queue.put_nowait((attempt, item))
+        except asyncio.QueueFull:
+            metrics.dispatch_dropped.labels(self.name, "full").inc()
+            logger.warning("Dispatch queue %s full, dropped an item", self.name)
+            return False
+        metrics.dispatch_depth.labels(self.name).set(queue.qsize())
+        return True
+
+    def submit(self, item: Any) -> bool:
+        """Enqueue item, False if it was dropped"""
+        return self._put(item)
+
+    async def _retry(self, item: Any, attempt: int) -> None:
+        await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+        metrics.dispatch_retries.labels(self.name).inc()
+        self._put(item, attempt + 1)
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            metrics.dispatch_depth.labels(self.name).set(queue.qsize())
+
+            attempts = {id(item): attempt for attempt, item in batch}
+            items = [item for _, item in batch]
+            try:
+                failed = await self.handler(items)
+            except Exception as ex:
+                logger.warning("Dispatch queue %s batch failed: %s", self.name, ex)
+                failed = items
+            metrics.dispatch_processed.labels(self.name).inc(len(items) - len(failed))
+
+            for item in failed:
+                attempt = attempts[id(item)]
+                if attempt < self.max_attempts:
+                    retry = asyncio.create_task(self._retry(item, attempt))
+                    self._retries.add(retry)
+                    retry.add_done_callback(self._retries.discard)
+                else:
+                    metrics.dispatch_dropped.labels(self.name, "failed").inc()
+            for _ in batch:
+                queue.task_done()
+
+    async def _settle(self) -> None:
+        # a retry re-enqueues its item, wait until neither is pending
+        while True:
+            await self._queue.join()
+            if not self._retries:
+                return
+            await asyncio.gather(*self._retries)
+
+    async def drain(self, timeout: float) -> None:
+        """
+        Give queued items, retries included, up to timeout seconds to be
+        handled, then stop
+        """
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            return
+        try:
+            await asyncio.wait_for(self._settle(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Dispatch queue %s stopped with %s items and %s retries",
+                self.name,
+                self._queue.qsize(),
+                len(self._retries),
+            )
+        for retry in list(self._retries):
+            retry.cancel()
+        if self._worker:
+            self._worker.cancel()
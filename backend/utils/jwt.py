@@ -31,7 +31,7 @@ class JWTBearer(HTTPBearer):
             msisdn = decoded_data.get("msisdn")
 
             if self.fetch_user:
-                if user := get_user(msisdn):
+                if user := await get_user(msisdn):
                     if user.refresh_token:
                         return user
                     raise exception  # User doesn't have a refresh_token
@@ -1,15 +1,221 @@
+import fcntl
+import glob
+import gzip
+import json
 import logging
-import logging.handlers
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, BinaryIO, Callable
 from utils.settings import settings
-from concurrent_log_handler import ConcurrentRotatingFileHandler
+
+
+class Lazy:
+    """A log value computed only when the record is handled (not by the caller)"""
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func: Callable[..., Any], *args: Any):
+        self.func = func
+        self.args = args
+
+    def resolve(self) -> Any:
+        return self.func(*self.args)
+
+
+def _resolve(value: Any) -> Any:
+    if isinstance(value, Lazy):
+        return value.resolve()
+    if isinstance(value, dict):
+        return {key: _resolve(item) for key, item in value.items()}
+    return value
+
+
+REDACTED = "***"
+
+
+def redact(value: Any, fields: set[str]) -> Any:
+    """Copy of value with the given keys masked, at any depth"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if key in fields else redact(item, fields)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item, fields) for item in value]
+    return value
+
+
+def _redact_text(text: str, fields: set[str]) -> str:
+    """Mask "field": "value" pairs of a json prefix that could not be parsed"""
+    if not fields:
+        return text
+    names = "|".join(re.escape(field) for field in fields)
+    return re.sub(rf'("(?:{names})"\s*:\s*)"[^"]*"?', rf'\1"{REDACTED}"', text)
+
+
+def decode_headers(raw: list[tuple[bytes, bytes]], allowed: set[str]) -> dict[str, str]:
+    return {
+        name: value.decode("latin-1")
+        for key, value in raw
+        if (name := key.decode("latin-1").lower()) in allowed
+    }
+
+
+def decode_body(
+    raw: bytes, truncated: bool, content_type: str, fields: set[str]
+) -> Any:
+    """Captured body as json when possible, else text (marked when truncated)"""
+    if not raw:
+        return {}
+    if not truncated and content_type.startswith("application/json"):
+        try:
+            return redact(json.loads(raw), fields)
+        except ValueError:
+            pass
+    text = _redact_text(raw.decode("utf-8", "replace"), fields)
+    return {"truncated": text} if truncated else text
+
+
+class QueuedFileHandler(logging.Handler):
+    """
+    Records are queued by the caller and written by a dedicated thread in
+    batches (Lazy props are resolved and records formatted there too). When
+    the file reaches max_bytes it is renamed, under a lock file as workers
+    share it, then gzipped in the background keeping backup_count archives.
+    A full queue drops the record rather than blocking the event loop.
+    """
+
+    # seconds a rotated file is left for other workers to reopen before gzip
+    compress_delay = 1.0
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int,
+        backup_count: int,
+        queue_size: int,
+        batch_size: int,
+    ):
+        super().__init__()
+        self.filename = os.path.abspath(filename)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.queue: queue.Queue[logging.LogRecord | None] = queue.Queue(queue_size)
+        self.written = 0
+        self.overflows = 0  # records refused by the full queue
+        self.dropped = 0  # records lost, overflows and failed writes
+        self._stream: BinaryIO | None = None
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # args may be mutated once the caller moves on
+        record.msg = record.getMessage()
+        record.args = None
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.overflows += 1
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = []
+            for record in batch:
+                if record is None:
+                    continue
+                try:
+                    if isinstance(props := getattr(record, "props", None), dict):
+                        record.props = _resolve(props)
+                    lines.append(self.format(record))
+                except Exception:
+                    self.dropped += 1
+            if lines:
+                self._write(("\n".join(lines) + "\n").encode(), len(lines))
+            if batch[-1] is None:
+                return
+
+    def _open(self) -> BinaryIO:
+        """The log file, reopened once another worker has rotated it"""
+        try:
+            inode = os.stat(self.filename).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._stream and os.fstat(self._stream.fileno()).st_ino != inode:
+            self._stream.close()
+            self._stream = None
+        if self._stream is None:
+            self._stream = open(self.filename, "ab")
+        return self._stream
+
+    def _write(self, data: bytes, count: int) -> None:
+        try:
+            stream = self._open()
+            stream.write(data)
+            stream.flush()
+            self.written += count
+            if os.fstat(stream.fileno()).st_size >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            self.dropped += count
+
+    def _rotate(self) -> None:
+        with open(f"{self.filename}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # another worker may have rotated it meanwhile
+            try:
+                if os.stat(self.filename).st_size < self.max_bytes:
+                    return
+            except FileNotFoundError:
+                return
+            rotated = f"{self.filename}.{datetime.now():%Y%m%d-%H%M%S-%f}"
+            os.rename(self.filename, rotated)
+        threading.Thread(target=self._compress, args=(rotated,), daemon=True).start()
+
+    def _compress(self, path: str) -> None:
+        time.sleep(self.compress_delay)
+        try:
+            with open(path, "rb") as src, gzip.open(f"{path}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+            archives = sorted(glob.glob(f"{glob.escape(self.filename)}.*.gz"))
+            for archive in archives[: max(len(archives) - self.backup_count, 0)]:
+                os.remove(archive)
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        """Write what is queued, called by logging.shutdown at exit"""
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join(timeout=5)
+        if not self._thread.is_alive() and self._stream:
+            self._stream.close()
+            self._stream = None
+        super().close()
 
 
 logger = logging.getLogger(settings.app_name)
 logger.setLevel(logging.INFO)
-log_handler = ConcurrentRotatingFileHandler(
-    f"{settings.log_path}/x-ljson.log", "a", 5_000_000, 10
+log_handler = QueuedFileHandler(
+    f"{settings.log_path}/x-ljson.log",
+    settings.log_max_bytes,
+    settings.log_backup_count,
+    settings.log_queue_size,
+    settings.log_batch_size,
 )
-# log_handler = logging.handlers.RotatingFileHandler(
-#    filename=f"{settings.log_path}/x-ljson.log", maxBytes=5_000_000, backupCount=10
-# )
 logger.addHandler(log_handler)
@@ -0,0 +1,135 @@
+""" Prometheus metrics """
+
+import os
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from utils.logger import log_handler
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+zend_latency = Histogram(
+    "zend_request_duration_seconds",
+    "Latency of zain backend calls",
+    ["endpoint"],
+    buckets=LATENCY_BUCKETS,
+)
+zend_responses = Counter(
+    "zend_responses_total",
+    "Zain backend calls by status code ('error' when no response)",
+    ["endpoint", "status_code"],
+)
+zend_response_bytes = Counter(
+    "zend_response_bytes_total",
+    "Payload bytes received from the zain backend",
+    ["endpoint"],
+)
+zend_retries = Counter(
+    "zend_retries_total",
+    "Retried zain backend reads",
+    ["endpoint"],
+)
+zend_retries_exhausted = Counter(
+    "zend_retries_exhausted_total",
+    "Retries skipped because the retry budget was exhausted",
+    ["endpoint"],
+)
+zend_hedges = Counter(
+    "zend_hedges_total",
+    "Hedge requests sent to the zain backend",
+    ["endpoint"],
+)
+zend_hedge_wins = Counter(
+    "zend_hedge_wins_total",
+    "Hedge requests that answered before the original one",
+    ["endpoint"],
+)
+route_latency = Histogram(
+    "http_request_duration_seconds",
+    "Latency of api routes",
+    ["method", "route", "status_code"],
+    buckets=LATENCY_BUCKETS,
+)
+dispatch_depth = Gauge(
+    "dispatch_queue_depth",
+    "Items waiting in a background dispatch queue",
+    ["queue"],
+    multiprocess_mode="livesum",
+)
+dispatch_processed = Counter(
+    "dispatch_processed_total",
+    "Items handled by a background dispatch queue",
+    ["queue"],
+)
+dispatch_retries = Counter(
+    "dispatch_retries_total",
+    "Items re-queued after a failure",
+    ["queue"],
+)
+dispatch_dropped = Counter(
+    "dispatch_dropped_total",
+    "Items dropped: queue full or out of attempts",
+    ["queue", "reason"],
+)
+
+# in-process collectors (values read at scrape time), see register_collector
+collectors: list = []
+
+
+def register_collector(collector) -> None:
+    """Expose collector on /metrics, also in multiprocess mode"""
+    collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+class LogCollector:
+    """Reads the log pipeline counters at scrape time"""
+
+    def collect(self):
+        yield GaugeMetricFamily(
+            "log_queue_depth",
+            "Records waiting for the log writer thread",
+            value=log_handler.queue.qsize(),
+        )
+        records = CounterMetricFamily(
+            "log_records", "Log records by outcome", labels=["outcome"]
+        )
+        records.add_metric(["written"], log_handler.written)
+        records.add_metric(["overflow"], log_handler.overflows)
+        records.add_metric(["dropped"], log_handler.dropped)
+        yield records
+
+
+register_collector(LogCollector())
+
+content_type = CONTENT_TYPE_LATEST
+
+
+def route_name(scope: dict) -> str:
+    """Path template of the matched route (never the raw path, to bound labels)"""
+    if route := scope.get("route"):
+        return route.path
+    return getattr(scope.get("endpoint"), "__name__", "unmatched")
+
+
+def render() -> bytes:
+    """
+    Text exposition of every metric. With several workers set
+    PROMETHEUS_MULTIPROC_DIR so the scraped worker reports all of them
+    (in-process collectors, e.g. caches & breakers, report that worker's).
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for collector in collectors:
+            registry.register(collector)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
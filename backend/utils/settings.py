@@ -1,7 +1,48 @@
 """ Application Settings """
 
 import os
-from pydantic import BaseSettings  # BaseModel,
+from pydantic import BaseModel, BaseSettings
+
+
+# request body & query params fields logged as "***", at any depth
+SECRET_FIELDS = {
+    "key",
+    "pincode",
+    "password",
+    "otp",
+    "confirmation",
+    "otp_confirmation",
+    "access_token",
+    "refresh_token",
+}
+# response body fields logged as "***", error codes etc. are kept
+RESPONSE_SECRET_FIELDS = {
+    "confirmation",
+    "otp_confirmation",
+    "access_token",
+    "refresh_token",
+}
+
+
+class LogPolicy(BaseModel):
+    """What the request log keeps of a route"""
+
+    # share of successful requests logged, errors are always logged
+    sample: float = 1.0
+    # bytes kept of the response body
+    body_max_bytes: int = 65_536
+    # request & response headers logged, the others are dropped
+    headers: set[str] = {
+        "content-type",
+        "content-length",
+        "user-agent",
+        "x-forwarded-for",
+        "idempotency-key",
+        "idempotent-replayed",
+    }
+    # fields masked in the request and in the response
+    redact: set[str] = SECRET_FIELDS
+    redact_response: set[str] = RESPONSE_SECRET_FIELDS
 
 
 class Settings(BaseSettings):
@@ -9,6 +50,12 @@ class Settings(BaseSettings):
 
     app_name: str = "galleon-middleware"
     log_path: str = "./logs/"
+    # rotated (then gzipped) past log_max_bytes, keeping log_backup_count files
+    log_max_bytes: int = 5_000_000
+    log_backup_count: int = 10
+    # records queued for the writer thread, dropped once full
+    log_queue_size: int = 100_000
+    log_batch_size: int = 500
     jwt_secret: str = ""
     jwt_algorithm: str = ""
     jwt_access_expires: int = 14400
@@ -20,8 +67,99 @@ class Settings(BaseSettings):
     registration_gift_offer_id: str = "2111742"
     zend_api: str = ""
     mock_zain_api: bool = False
+    # mock mode: log-normal upstream latency (seconds) and error rate
+    mock_zain_latency_median: float = 0.0
+    mock_zain_latency_sigma: float = 0.5
+    mock_zain_error_rate: float = 0.0
+    zend_timeout: float = 10.0
+    zend_connect_timeout: float = 3.0
+    zend_max_connections: int = 100
+    zend_max_keepalive_connections: int = 20
+    zend_keepalive_expiry: float = 30.0
+    # shared deadline of the upstream calls fanned out by one endpoint
+    zend_deadline: float = 15.0
+    zend_breaker_failure_threshold: int = 5
+    zend_breaker_reset_timeout: float = 30.0
+    # max concurrent calls per zend endpoint, extra calls fail fast
+    zend_bulkhead_limit: int = 50
+    # retries of idempotent reads: extra attempts, backoff (seconds) & budget
+    zend_retry_attempts: int = 2
+    zend_retry_base_delay: float = 0.05
+    zend_retry_max_delay: float = 1.0
+    zend_retry_budget_ratio: float = 0.1
+    zend_retry_budget_min_per_second: float = 1.0
+    zend_retry_budget_cap: float = 20.0
+    # hedged reads: a second request once the first is slower than the
+    # percentile of the last zend_hedge_window latencies, for at most
+    # zend_hedge_max_ratio of the reads
+    zend_hedge: bool = False
+    zend_hedge_percentile: float = 0.95
+    zend_hedge_window: int = 1_000
+    zend_hedge_min_samples: int = 100
+    zend_hedge_max_ratio: float = 0.05
+    zend_hedge_budget_cap: float = 10.0
+    # batch status: max msisdns per request (kept small, each one is a zend
+    # lookup), msisdns looked up concurrently
+    zend_batch_max_size: int = 50
+    zend_batch_concurrency: int = 20
+    zend_cache_size: int = 10_000
+    # fresh for zend_cache_ttl; slow-changing lookups (is_4g_compatible) are then
+    # served stale while refreshed, up to the stale ttl
+    zend_cache_ttl: float = 300.0
+    zend_cache_stale_ttl: float = 86_400.0
+    # remembered ineligible msisdns, rejected on otp/registration without zend
+    zend_ineligible_cache_size: int = 100_000
+    zend_ineligible_cache_ttl: float = 3_600.0
+    # "" (disabled), "sqlite" or "redis"
+    zend_shared_cache: str = ""
+    zend_shared_cache_path: str = "/dev/shm/galleon-zend-cache.sqlite3"
+    zend_shared_cache_url: str = "redis://localhost:6379/0"
+    # seconds, per zend endpoint; endpoints not listed are never shared
+    zend_shared_cache_ttls: dict[str, float] = {
+        "wewebit/query-usim-service": 86_400,
+        "esb/subscriber-information": 300,
+        "cbs/query-mgr-service": 60,
+        "esb/free-units": 30,
+        "esb/billing-details": 300,
+        "esb/query-balance": 10,
+    }
+
+    # background queues (otp sms, slack), handled after the response is sent
+    dispatch_queue_size: int = 10_000
+    dispatch_batch_size: int = 20
+    dispatch_max_attempts: int = 3
+    # seconds queued items are given to go out on shutdown
+    dispatch_drain_timeout: float = 5.0
+
+    # orjson responses, skipping response_model re-validation (needs orjson)
+    fast_json: bool = False
+    # request log policy by route path, routes not listed use log_policy
+    log_policy: LogPolicy = LogPolicy()
+    log_policies: dict[str, LogPolicy] = {
+        "/api/number/query-bill": LogPolicy(body_max_bytes=1_024),
+        "/api/number/status/batch": LogPolicy(sample=0.1, body_max_bytes=1_024),
+        "/api/number/home": LogPolicy(sample=0.1, body_max_bytes=4_096),
+        "/api/number/status": LogPolicy(sample=0.25),
+        "/": LogPolicy(sample=0.01),
+        # the otp code is only a secret in this request
+        "/api/otp/confirm": LogPolicy(redact=SECRET_FIELDS | {"code"}),
+    }
+
+    # "sql" (otp table) or "memory" (node-local file shared by the workers)
+    otp_store: str = "sql"
+    otp_store_path: str = "/dev/shm/galleon-otp.sqlite3"
+    # seconds an otp (and its confirmation) is valid, expired ones are swept
+    otp_ttl: float = 900.0
+    otp_sweep_interval: float = 60.0
 
     api_key: str = ""
+    # seconds a stored Idempotency-Key response is replayed
+    idempotency_ttl: float = 86_400.0
+    # seconds a duplicate waits for the first request to complete
+    idempotency_wait: float = 30.0
+    # seconds an unfinished first request holds its key, past them (e.g. its
+    # worker was killed) a retry takes the key over
+    idempotency_lease: float = 60.0
 
     database_url: str = ""
 